@@ -0,0 +1,47 @@
+# Cryptopaper image assets: loaded once, scaled to the size they are drawn at and packed into one atlas surface
+import glob, os
+import pygame
+
+class Atlas:
+    # Images by name on shelves of a single surface. Files are read again only after their modification time changes:
+    # check() stats them (from any thread) and the render thread reloads on its next frame
+    def __init__(self, directory: str, scales: dict = None, width: int = 1024):
+        self.directory, self.scales, self.width = directory, scales or {}, width
+        self.surface, self.rects, self.generated, self.mtimes = None, {}, {}, {}
+        self.version, self.stale = 0, True
+
+    def file_mtimes(self):
+        return {os.path.splitext(os.path.basename(path))[0]: os.stat(path).st_mtime_ns for path in glob.glob(os.path.join(self.directory, '*.png'))}
+
+    def check(self):
+        try:
+            if self.file_mtimes() != self.mtimes: self.stale = True
+        except OSError: self.stale = True # A file vanished mid-scan
+
+    def add(self, name: str, image, scale: float = 1.0):
+        # Images made at runtime, such as the QR code, go into the atlas too
+        self.generated[name] = image, scale
+        self.stale = True
+
+    def load(self):
+        self.mtimes = self.file_mtimes()
+        images = {name: (pygame.image.load(os.path.join(self.directory, name + '.png')), self.scales.get(name, 1.0)) for name in self.mtimes}
+        images.update(self.generated)
+        scaled = {}
+        for name, (image, scale) in images.items():
+            if scale != 1.0: image = pygame.transform.scale(image, (int(image.get_width() * scale), int(image.get_height() * scale)))
+            scaled[name] = image
+        # Shelf packing: tallest first, left to right, a new shelf when a row is full
+        width = max([self.width] + [image.get_width() for image in scaled.values()])
+        x = y = shelf = 0
+        rects = {}
+        for name, image in sorted(scaled.items(), key = lambda item: -item[1].get_height()):
+            if x + image.get_width() > width: x, y, shelf = 0, y + shelf, 0
+            rects[name] = pygame.Rect((x, y), image.get_size())
+            x, shelf = x + image.get_width(), max(shelf, image.get_height())
+        surface = pygame.Surface((width, max(y + shelf, 1)), pygame.SRCALPHA)
+        for name, image in scaled.items(): surface.blit(image, rects[name], special_flags = pygame.BLEND_RGBA_MAX) # Copy pixels and alpha as they are
+        self.surface, self.rects, self.stale, self.version = surface, rects, False, self.version + 1
+
+    def blit(self, canvas, name: str, x: int, y: int):
+        return canvas.blit(self.surface, (x, y), self.rects[name])
@@ -0,0 +1,227 @@
+# Cryptopaper benchmarks: headless rendering and fetching against the recorded data in fixtures/
+# Usage:
+#   python3 bench.py                  render and fetch timings, memory use
+#   python3 bench.py 800 1872         native drawing against --smoothscale at these widths (--sizes for common panel sizes)
+#   python3 bench.py --profile        also print the top functions of the render loop under cProfile
+#   python3 bench.py --tracemalloc    also print the top allocation sites of the render loop
+#   python3 bench.py --save           store the results as the baseline
+#   python3 bench.py --check          exit 1 if anything got slower or bigger than the baseline allows
+import asyncio, csv, hashlib, http.server, json, os, random, resource, subprocess, sys, tempfile, threading, timeit
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+FIXTURES = os.path.join(HERE, 'fixtures')
+BASELINE = os.path.join(HERE, 'bench-baseline.json')
+SIZES = [800, 1024, 1200, 1872, 2200] # Widths; heights are 3/4 of these
+FRAMES = 20
+TOLERANCE, NOISE_MS, NOISE_KB = 0.25, 0.5, 1024 # A regression is 25% worse than the baseline and more than the noise floor
+
+def best_ms(function, number: int = FRAMES, repeat: int = 5):
+    # Best of `repeat` runs of `number` calls, in ms per call
+    return min(timeit.repeat(function, number = number, repeat = repeat)) / number * 1000
+
+class FixtureHandler(http.server.SimpleHTTPRequestHandler):
+    # Serves fixtures/ the way the real sources do: with ETags, 304s and suffix ranges
+    def __init__(self, *args, **kwargs): super().__init__(*args, directory = FIXTURES, **kwargs)
+    def log_message(self, *args): pass
+
+    def do_GET(self):
+        path = self.translate_path(self.path.split('?')[0])
+        if not os.path.isfile(path):
+            path = os.path.join(FIXTURES, 'weather.txt') if self.path.startswith('/weather/') else path
+            if not os.path.isfile(path): return self.send_error(404)
+        with open(path, 'rb') as f: data = f.read()
+        etag = '"' + hashlib.sha1(data).hexdigest()[:16] + '"'
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        status, body = 200, data
+        if self.headers.get('Range', '').startswith('bytes=-'):
+            status, body = 206, data[-int(self.headers['Range'][7:]):]
+        self.send_response(status)
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(body)))
+        if status == 206: self.send_header('Content-Range', f'bytes {len(data) - len(body)}-{len(data) - 1}/{len(data)}')
+        self.end_headers()
+        self.wfile.write(body)
+
+def fixture_server():
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), FixtureHandler)
+    threading.Thread(target = server.serve_forever, daemon = True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}'
+
+def news_fetcher(c):
+    # fetch_news_source through one session on a private event loop, called synchronously so it is timed like everything else
+    import aiohttp
+    loop = asyncio.new_event_loop()
+    async def open_session(): return aiohttp.ClientSession()
+    session = loop.run_until_complete(open_session())
+    def fetch(kind: str, url: str): return loop.run_until_complete(c.fetch_news_source(session, kind, url))
+    def close():
+        loop.run_until_complete(session.close())
+        loop.close()
+    return fetch, close
+
+def load_candles():
+    with open(os.path.join(FIXTURES, 'btcusd-candles.csv')) as f:
+        return [[float(value) for value in row] for row in list(csv.reader(f))[1:]]
+
+def fetch_suite(c):
+    # Fetchers and parsers against the local fixture server; `cold` runs clear every cache first
+    from headlines import extract_headlines, chunked, parse_feed
+    server, url = fixture_server()
+    c.WEATHER_URL = url + '/weather/{}'
+    c.WAR_DATASET, c.WAR_CACHE = url + '/russia_losses_{}.json', os.path.join(tempfile.mkdtemp(), 'war-stats.json')
+    c.LOCATION, c.weather = 'New York', ''
+    fetch_news, close_news = news_fetcher(c)
+    def news_cold(kind: str, path: str):
+        c.news_cache.clear()
+        fetch_news(kind, url + path)
+    def war_cold():
+        if os.path.exists(c.WAR_CACHE): os.remove(c.WAR_CACHE)
+        c.fetch_orc_stats(c.WAR_DAYS)
+    with open(os.path.join(FIXTURES, 'bbc-world.html'), 'rb') as f: page = f.read()
+    with open(os.path.join(FIXTURES, 'bbc-world.rss'), 'rb') as f: feed = f.read()
+    results = {
+        'fetch.news_html_ms': best_ms(lambda: news_cold('html', '/bbc-world.html'), 5),
+        'fetch.news_html_304_ms': best_ms(lambda: fetch_news('html', url + '/bbc-world.html'), 5),
+        'fetch.news_rss_ms': best_ms(lambda: news_cold('rss', '/bbc-world.rss'), 5),
+        'fetch.news_rss_304_ms': best_ms(lambda: fetch_news('rss', url + '/bbc-world.rss'), 5),
+        'fetch.orc_stats_ms': best_ms(war_cold, 5),
+        'fetch.orc_stats_304_ms': best_ms(lambda: c.fetch_orc_stats(c.WAR_DAYS), 5),
+        'fetch.weather_ms': best_ms(c.fetch_weather),
+        'parse.headlines_ms': best_ms(lambda: extract_headlines(chunked(page))),
+        'parse.feed_ms': best_ms(lambda: parse_feed(feed, 'bbc')),
+    }
+    close_news()
+    server.shutdown()
+    return results
+
+def populate(c):
+    # Fill the display's globals from the fixtures, fetching through the fixture server like a real start
+    server, url = fixture_server()
+    c.WEATHER_URL = url + '/weather/{}'
+    c.WAR_DATASET, c.WAR_CACHE = url + '/russia_losses_{}.json', os.path.join(tempfile.mkdtemp(), 'war-stats.json')
+    c.LTC_ALARM, c.LOCATION = 0.004, 'New York'
+    c.load_watch_list()
+    c.candle_store.merge(load_candles(), replace = True)
+    c.refresh_chart(reload = True)
+    c.btc_usd_spot, c.ltc_btc_rate = c.candle_store.last(1)[0, c.CLOSE], 0.0039
+    from headlines import HeadlineIndex, rank_headlines
+    fetch_news, close_news = news_fetcher(c)
+    c.news, c.weather = rank_headlines(fetch_news('html', url + '/bbc-world.html'), HeadlineIndex(c.NEWS_TTL), c.watch_matcher), c.fetch_weather()
+    close_news()
+    c.orc_figures, c.war_day, c.war_today_stats, c.war_today_change = c.fetch_orc_stats(c.WAR_DAYS)
+    c.ASSETS.add('qr', c.pygame.Surface((444, 444)), c.layout.scale)
+    c.ASSETS.load()
+    server.shutdown()
+
+def second_frame(c):
+    # A typical frame: only the second hand moves
+    c.widget_inputs.pop('second_hand', None)
+    return c.present(c.render_widgets())
+
+def render_suite(c):
+    results = {'render.full_ms': best_ms(lambda: c.present(c.render_widgets(force = True))), 'render.second_ms': best_ms(lambda: second_frame(c))}
+    for name, rect, _, draw in c.WIDGETS:
+        def widget():
+            c.display.set_clip(c.layout.area(rect))
+            c.display.fill(c.white)
+            draw()
+        results[f'widget.{name}_ms'] = best_ms(widget)
+    c.display.set_clip(None)
+    def print_cold():
+        c.text_cache.clear()
+        c.print_at(c.display, 0, 12, ' 12:34 ', 204, True)
+    results['text.print_at_ms'] = best_ms(lambda: c.print_at(c.display, 0, 12, ' 12:34 ', 204, True))
+    results['text.print_at_cold_ms'] = best_ms(print_cold)
+    return results
+
+def memory_suite(c, frames: int = 300):
+    # Peak Python allocations over a run of frames, with a new candle every 30 frames, and the process's peak RSS
+    import tracemalloc
+    tracemalloc.start()
+    price, t = c.btc_usd_spot, c.candle_store.last(1)[0, c.T]
+    for i in range(frames):
+        if i % 30 == 0:
+            t += c.SECS_PER_CANDLE
+            price += random.gauss(0, 10)
+            c.candle_store.add(price, 0.1, t)
+            c.refresh_chart()
+        second_frame(c)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {'memory.render_peak_kb': peak / 1024, 'memory.rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}
+
+def profile(c, tracing: bool):
+    # Where the render loop's time (cProfile) or memory (tracemalloc) goes, written to stderr
+    def frames():
+        for i in range(60): c.present(c.render_widgets(force = True)) if i % 10 == 0 else second_frame(c)
+    if tracing:
+        import tracemalloc
+        tracemalloc.start(10)
+        frames()
+        for stat in tracemalloc.take_snapshot().statistics('lineno')[:15]: print(stat, file = sys.stderr)
+        tracemalloc.stop()
+    else:
+        import cProfile, pstats
+        profiler = cProfile.Profile()
+        profiler.runcall(frames)
+        pstats.Stats(profiler, stream = sys.stderr).sort_stats('cumulative').print_stats(25)
+
+def run_worker(suite: str, width: int, smoothscale: bool, flags):
+    sys.argv = ['cryptopaper.py', str(width), '--headless'] + (['--smoothscale'] if smoothscale else [])
+    random.seed(1)
+    import cryptopaper as c
+    if suite == 'fetch': return fetch_suite(c)
+    populate(c)
+    if suite == 'scale': return {'full_ms': best_ms(lambda: c.present(c.render_widgets(force = True))), 'second_ms': best_ms(lambda: second_frame(c))}
+    results = render_suite(c)
+    if '--profile' in flags or '--tracemalloc' in flags: profile(c, '--tracemalloc' in flags)
+    results.update(memory_suite(c))
+    return results
+
+def worker(suite: str, width: int = 2200, mode: str = 'native', flags = ()):
+    # Each suite imports cryptopaper afresh, as its layout is fixed at import
+    out = subprocess.run([sys.executable, __file__, '--worker', suite, str(width), mode, *flags], stdout = subprocess.PIPE, text = True, check = True, env = {**os.environ, 'PYGAME_HIDE_SUPPORT_PROMPT': '1'})
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+def compare_sizes(widths):
+    print(f"{'size':>11}  {'native full':>12} {'smoothscale full':>17}  {'native 1s':>10} {'smoothscale 1s':>15}")
+    for width in widths:
+        native, smooth = worker('scale', width, 'native'), worker('scale', width, 'smoothscale')
+        print(f"{f'{width}x{width // 4 * 3}':>11}  {native['full_ms']:>10.1f}ms {smooth['full_ms']:>15.1f}ms  {native['second_ms']:>8.2f}ms {smooth['second_ms']:>13.2f}ms")
+
+def regressions(results: dict, baseline: dict):
+    worse = []
+    for name, value in results.items():
+        base = baseline.get(name)
+        if base is None: continue
+        noise = NOISE_KB if name.endswith('_kb') else NOISE_MS
+        if value > base * (1 + TOLERANCE) and value - base > noise: worse.append((name, base, value))
+    return worse
+
+def main(args):
+    flags = [arg for arg in args if arg.startswith('--')]
+    widths = [int(arg) for arg in args if arg.isdigit()] or (SIZES if '--sizes' in flags else [])
+    if widths: return compare_sizes(widths)
+    results = {**worker('render', flags = [flag for flag in flags if flag in ('--profile', '--tracemalloc')]), **worker('fetch')}
+    try:
+        with open(BASELINE) as f: baseline = json.load(f)
+    except OSError: baseline = {}
+    for name, value in results.items():
+        base = f"   (baseline {baseline[name]:.2f})" if name in baseline else ''
+        print(f"{name:<32} {value:>10.2f}{base}")
+    if '--save' in flags:
+        with open(BASELINE, 'w') as f: json.dump(results, f, indent = 1, sort_keys = True)
+        print(f'Saved baseline to {BASELINE}')
+    if '--check' in flags:
+        if not baseline: sys.exit(f'No baseline at {BASELINE}; run with --save first')
+        worse = regressions(results, baseline)
+        for name, base, value in worse: print(f'REGRESSION {name}: {base:.2f} -> {value:.2f} ({100 * (value / base - 1):+.0f}%)')
+        if worse: sys.exit(1)
+        print('No regressions')
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--worker']: print(json.dumps(run_worker(sys.argv[2], int(sys.argv[3]), sys.argv[4] == 'smoothscale', sys.argv[5:])))
+    else: main(sys.argv[1:])
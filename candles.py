@@ -0,0 +1,259 @@
+# Cryptopaper candle storage and rolling statistics
+from collections import deque
+import math, os, threading, time
+import numpy as np
+
+T, OPEN, HIGH, LOW, CLOSE, VOLUME = range(6) # Candle record columns
+RECORD = np.dtype('<f8') # Candle log records are six little-endian doubles
+RECORD_SIZE = RECORD.itemsize * 6
+TIMEFRAMES = {'30s': 30, '1m': 60, '2m': 120, '5m': 300, '15m': 900, '1h': 3600, '1d': 86400}
+
+class RollingWindow:
+    # Fixed-capacity window of values with O(1) amortised min/max, tracked with monotonic deques of (serial, value)
+    def __init__(self, capacity: int):
+        self.capacity, self.count = capacity, 0
+        self.values = deque(maxlen = capacity)
+        self._lows, self._highs = deque(), deque()
+
+    def push(self, value):
+        serial, self.count = self.count, self.count + 1
+        self.values.append(value)
+        while self._lows and self._lows[-1][1] >= value: self._lows.pop()
+        while self._highs and self._highs[-1][1] <= value: self._highs.pop()
+        self._lows.append((serial, value))
+        self._highs.append((serial, value))
+        oldest = self.count - self.capacity
+        while self._lows[0][0] < oldest: self._lows.popleft()
+        while self._highs[0][0] < oldest: self._highs.popleft()
+
+    def amend(self, value):
+        # Replace the newest value, e.g. for a candle that is still open. The old one may have evicted values that count again,
+        # so the deques are rebuilt in one vectorised pass: they hold each value below (or above) everything after it
+        self.values[-1] = value
+        values, first = np.array(self.values), self.count - len(self.values)
+        lows = np.flatnonzero(values < np.append(np.minimum.accumulate(values[::-1])[::-1][1:], np.inf))
+        highs = np.flatnonzero(values > np.append(np.maximum.accumulate(values[::-1])[::-1][1:], -np.inf))
+        self._lows, self._highs = deque(zip((lows + first).tolist(), values[lows].tolist())), deque(zip((highs + first).tolist(), values[highs].tolist()))
+
+    @property
+    def min(self): return self._lows[0][1] if self._lows else 0
+
+    @property
+    def max(self): return self._highs[0][1] if self._highs else 0
+
+    @property
+    def full(self): return len(self.values) == self.capacity
+
+    def __len__(self): return len(self.values)
+    def __getitem__(self, i): return self.values[i]
+    def __iter__(self): return iter(self.values)
+
+class RollingSum:
+    # Sum and mean of the last `capacity` values in O(1). Re-summed exactly once every `capacity` pushes, so rounding errors cannot build up
+    def __init__(self, capacity: int):
+        self.values, self.total, self.pushes = deque(maxlen = capacity), 0.0, 0
+
+    def push(self, value: float):
+        if len(self.values) == self.values.maxlen: self.total -= self.values[0]
+        self.values.append(value)
+        self.total += value
+        self.pushes += 1
+        if self.pushes % self.values.maxlen == 0: self.total = math.fsum(self.values)
+
+    @property
+    def mean(self): return self.total / len(self.values) if self.values else 0
+
+    def __len__(self): return len(self.values)
+
+class WindowStats:
+    # Indicators over the last `count` closed candles, each updated in O(1) (amortised for the high and low) per candle
+    def __init__(self, count: int):
+        self.count, self.alpha = count, 2 / (count + 1)
+        self.highs, self.lows = RollingWindow(count), RollingWindow(count)
+        self.closes, self.squared_returns, self.true_ranges, self.traded, self.volume = (RollingSum(count) for _ in range(5))
+        self.ema, self.previous = None, None
+
+    def push(self, row):
+        high, low, close, volume = row[HIGH], row[LOW], row[CLOSE], row[VOLUME]
+        self.highs.push(high)
+        self.lows.push(low)
+        self.closes.push(close)
+        if self.previous and close > 0:
+            self.squared_returns.push(math.log(close / self.previous) ** 2)
+            self.true_ranges.push(max(high, self.previous) - min(low, self.previous))
+        else: self.true_ranges.push(high - low)
+        self.traded.push((high + low + close) / 3 * volume)
+        self.volume.push(volume)
+        self.ema = close if self.ema is None else self.ema + self.alpha * (close - self.ema)
+        self.previous = close
+
+    def values(self) -> dict:
+        # Realized volatility is over the whole window, not annualised; VWAP needs traded volume, so it is None for polled prices
+        high, low = self.highs.max, self.lows.min
+        return {'candles': len(self.closes), 'high': high, 'low': low, 'range_pct': (high - low) / high * 100 if high else 0.0,
+            'sma': self.closes.mean, 'ema': self.ema or 0.0, 'volatility_pct': math.sqrt(max(self.squared_returns.total, 0)) * 100,
+            'atr': self.true_ranges.mean, 'vwap': self.traded.total / self.volume.total if self.volume.total > 0 else None}
+
+class Indicators:
+    # WindowStats for several named windows (in seconds), fed each candle as it closes
+    def __init__(self, windows: dict, secs: int = 30):
+        self.windows, self.secs = windows, secs
+        self.reset()
+
+    def reset(self):
+        self.stats = {name: WindowStats(max(1, seconds // self.secs)) for name, seconds in self.windows.items()}
+        self.version, self.cached = 0, (-1, {})
+
+    @property
+    def longest(self): return max((stats.count for stats in self.stats.values()), default = 0)
+
+    def push(self, row):
+        row = [float(value) for value in row] # Plain floats are quicker to work with than numpy scalars
+        for stats in self.stats.values(): stats.push(row)
+        self.version += 1
+
+    def snapshot(self) -> dict:
+        # {window: {indicator: value}}, rebuilt only after a candle has closed
+        if self.cached[0] != self.version: self.cached = (self.version, {name: stats.values() for name, stats in self.stats.items()})
+        return self.cached[1]
+
+class CandleStore:
+    # Preallocated ring buffer of OHLCV candles, one row per `secs` bucket. Samples may arrive from any thread.
+    def __init__(self, capacity: int, secs: int = 30, windows: dict = None):
+        self.capacity, self.secs = capacity, secs
+        self.indicators = Indicators(windows or {}, secs)
+        self.data = np.zeros((capacity, 6))
+        self.head, self.length, self.version = -1, 0, 0
+        self.gaps, self.sampled = 0, True # Candles closed without a single sample, including buckets skipped altogether
+        self.lock = threading.Lock()
+        self.log, self.logged = None, 0
+        self._series = {}
+
+    def __len__(self): return self.length
+
+    def attach(self, log):
+        # Rehydrate from a candle log, then append every candle closed from now on to it
+        rows = log.tail(self.capacity)
+        with self.lock:
+            self.data[:len(rows)] = rows
+            self.head, self.length, self.version = len(rows) - 1, len(rows), self.version + 1
+            self.log, self.logged = log, rows[-1, T] if len(rows) else 0
+            self.indicators.reset()
+            for row in rows[-self.indicators.longest - 1:-1]: self.indicators.push(row) # The newest is still open
+        return len(rows)
+
+    def _open(self, bucket_time, price, sampled: bool = True):
+        if self.length:
+            self.gaps += (not self.sampled) + max(0, int(bucket_time - self.data[self.head][T]) // self.secs - 1)
+            self.indicators.push(self.data[self.head]) # Closing
+        self.sampled = sampled
+        if self.log and self.length and self.data[self.head][T] > self.logged:
+            self.logged = self.data[self.head][T]
+            self.log.append(self.data[self.head])
+        self.head = (self.head + 1) % self.capacity
+        self.data[self.head] = (bucket_time, price, price, price, price, 0.0)
+        self.length = min(self.length + 1, self.capacity)
+
+    def add(self, price: float, volume: float = 0.0, t: float = None):
+        # Fold a price sample or trade into the candle for its bucket
+        bucket_time = (int(time.time() if t is None else t) // self.secs) * self.secs
+        with self.lock:
+            row = self.data[self.head]
+            if not self.length or bucket_time > row[T]: self._open(bucket_time, price)
+            elif bucket_time < row[T]: return # Late sample for a closed candle
+            row, self.sampled = self.data[self.head], True
+            row[HIGH], row[LOW], row[CLOSE] = max(row[HIGH], price), min(row[LOW], price), price
+            row[VOLUME] += volume
+            self.version += 1
+
+    def roll(self, t: float, price: float):
+        # Make sure the bucket for t exists, carrying the price forward if nothing was sampled during it
+        bucket_time = (int(t) // self.secs) * self.secs
+        with self.lock:
+            if self.length and bucket_time <= self.data[self.head][T]: return
+            self._open(bucket_time, price, False)
+            self.version += 1
+
+    def merge(self, rows, replace: bool = False):
+        # Upsert whole candles, e.g. from a hub: a row for the open candle replaces it and newer rows open new ones.
+        # `replace` drops what was there first
+        with self.lock:
+            if replace:
+                self.head, self.length = -1, 0
+                self.indicators.reset()
+            for row in rows:
+                if not self.length or row[T] > self.data[self.head][T]: self._open(row[T], row[CLOSE])
+                elif row[T] < self.data[self.head][T]: continue
+                self.data[self.head] = row
+            self.version += 1
+
+    def indicator_values(self) -> dict:
+        with self.lock: return self.indicators.snapshot()
+
+    def last(self, count: int = None):
+        # Copy of the newest `count` candles in chronological order
+        with self.lock:
+            count = self.length if count is None else min(count, self.length)
+            return self.data[(self.head - count + 1 + np.arange(count)) % self.capacity]
+
+    def series(self, timeframe: int, count: int):
+        # Newest `count` candles resampled to `timeframe` seconds; cached until new data arrives
+        cached = self._series.get((timeframe, count))
+        if cached and cached[0] == self.version: return cached[1]
+        version = self.version
+        result = resample(self.last(count * max(1, timeframe // self.secs)), timeframe)[-count:]
+        self._series[(timeframe, count)] = (version, result)
+        return result
+
+def resample(candles, timeframe: int):
+    # Aggregate chronological OHLCV rows into `timeframe` second buckets without Python-level loops
+    if not len(candles): return candles
+    buckets = candles[:, T] // timeframe
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(buckets)) + 1))
+    ends = np.concatenate((starts[1:], [len(candles)])) - 1
+    result = np.empty((len(starts), 6))
+    result[:, T] = buckets[starts] * timeframe
+    result[:, OPEN] = candles[starts, OPEN]
+    result[:, HIGH] = np.maximum.reduceat(candles[:, HIGH], starts)
+    result[:, LOW] = np.minimum.reduceat(candles[:, LOW], starts)
+    result[:, CLOSE] = candles[ends, CLOSE]
+    result[:, VOLUME] = np.add.reduceat(candles[:, VOLUME], starts)
+    return result
+
+class CandleLog:
+    # Append-only log of fixed-width candle records, split into numbered segments of which only the newest `keep` are retained
+    def __init__(self, directory: str, segment_records: int, keep: int = 2):
+        self.directory, self.segment_records, self.keep = directory, segment_records, keep
+        os.makedirs(directory, exist_ok = True)
+        self.file = None
+        segments = self.segments()
+        self._rotate(int(segments[-1][-10:-4]) if segments else 1)
+
+    def segments(self): return sorted(os.path.join(self.directory, f) for f in os.listdir(self.directory) if f.startswith('candles-') and f.endswith('.bin'))
+
+    def _rotate(self, number: int):
+        if self.file: self.file.close()
+        path = os.path.join(self.directory, f'candles-{number:06d}.bin')
+        self.file = open(path, 'ab')
+        self.file.truncate(self.file.tell() - self.file.tell() % RECORD_SIZE) # Drop any torn record from a crash
+        for old in self.segments()[:-self.keep]: os.remove(old)
+
+    def append(self, row):
+        self.file.write(np.asarray(row, dtype = RECORD).tobytes())
+        self.file.flush()
+        if self.file.tell() >= self.segment_records * RECORD_SIZE: self._rotate(int(self.file.name[-10:-4]) + 1)
+
+    def tail(self, count: int):
+        # Newest `count` records, memory-mapped from the end of the newest segments so the cost never depends on log size
+        parts = []
+        for path in reversed(self.segments()):
+            records = os.path.getsize(path) // RECORD_SIZE
+            if not records: continue
+            take = min(count, records)
+            parts.insert(0, np.array(np.memmap(path, dtype = RECORD, mode = 'r', shape = (records, 6))[-take:]))
+            count -= take
+            if not count: break
+        return np.concatenate(parts) if parts else np.zeros((0, 6))
+
+    def close(self):
+        if self.file: self.file.close()
@@ -1,112 +1,531 @@
 #!/usr/bin/env python3
 ## (c) 2021-2023  Kerry Fraser-Robinson
-import os
+import os, time
+START_TIME = time.monotonic() # For time to first frame
 os.environ['PYGAME_HIDE_SUPPORT_PROMPT'] = "hide"
-import pygame, asyncio, aiohttp, json, threading
+import pygame, asyncio, aiohttp, json, signal, threading
 from aiohttp import ClientTimeout
-import datetime, time, math, socket, urllib, string, io, sys, subprocess, qrcode
-from bs4 import BeautifulSoup
+import datetime, math, bisect, codecs, collections, hashlib, resource, socket, urllib, urllib.request, urllib.error, string, io, sys, subprocess, tempfile, qrcode
+from headlines import extract_headlines, chunked, parse_feed, HeadlineIndex, rank_headlines, WatchMatcher
+from candles import RollingWindow, CandleStore, CandleLog, TIMEFRAMES, T, HIGH, LOW, CLOSE
+import epaper
+from assets import Atlas
+from metrics import Registry
+from layout import Layout
+from files import replace
  
 os.chdir(os.path.dirname(os.path.abspath(__file__)))
 LIBDIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'lib')
+CACHEDIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'cache')
 TITLE, VERSION = 'Cryptopaper', 'v1.2.0'
 
+ARGS = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+def option(name: str, default = None):
+    # Value of a `--name=value` command line flag; bare `--name` gives True
+    for arg in sys.argv[1:]:
+        if arg == f'--{name}': return True
+        if arg.startswith(f'--{name}='): return arg.split('=', 1)[1]
+    return default
+
 WIN_W, WIN_H, CHART_TOP, CHART_BOTTOM = 2200, 1650, 450, 1450
 CHART_HEIGHT = CHART_BOTTOM - CHART_TOP
-CHART_COL_W, MAX_CANDLES, SECS_PER_CANDLE =  16, 720, 30
+CHART_COL_W, SECS_PER_CANDLE, CHART_POINTS =  16, 30, 720
+def timeframe_for(hours: float): return next((secs for secs in TIMEFRAMES.values() if secs * CHART_POINTS >= hours * 3600), TIMEFRAMES['1d'])
+chart_timeframe = TIMEFRAMES.get(option('timeframe'), timeframe_for(float(option('hours', 6)))) # Six hours of 30s candles by default
+STORE_CANDLES = max(7 * 86400, CHART_POINTS * chart_timeframe) // SECS_PER_CANDLE # At least a week of history for the longer timeframes
 NL, MIN_CONTRAST, BLACK, white = "\n", 155, (0, 0, 0), (255, 255, 255) # white can be adjusted for contrast
 VI_RADIUS, VI_RATIO = 100.0, 10 # Volatility indicator
 VI_CENTER = WIN_W // 2, WIN_H - VI_RADIUS 
-T_START, TIMEOUT, FPS = int(time.time()) // 60, 1.0, 30
-candles, news, font_cache, ip_addr, weather, btc_usd_spot, ltc_btc_rate = [], [], {}, '', '', 0, 0
+CLOCK = time.time # Everything scheduled or displayed goes by this; replay.py swaps in a simulated clock
+T_START, TIMEOUT, STATS_INTERVAL = int(CLOCK()) // 60, 1.0, 600
+LOW_POWER = 60 if option('low-power') is True else int(option('low-power', 0)) # Seconds between frames with --low-power[=N]; new data waits for the next one
+SECOND_HAND = not (LOW_POWER or option('no-seconds')) # Without the second hand a frame a minute will do, plus one for each change of data
+news, font_cache, ip_addr, weather, btc_usd_spot, ltc_btc_rate = [], {}, '', '', 0, 0
+TEXT_CACHE_SIZE, text_cache, text_stats = 512, collections.OrderedDict(), {'hits': 0, 'misses': 0} # Rendered lines of text, least recently used first
+def seconds(span: str): return int(float(span[:-1]) * {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}[span[-1]]) if span[-1] in 'smhd' else int(span)
+INDICATOR_WINDOWS = {span: seconds(span) for span in option('windows', '1h,6h,1d').split(',')} # Volatility, ATR, VWAP and so on over each of these
+candle_store, chart_high, chart_low, chart_bucket, chart_version = CandleStore(STORE_CANDLES, SECS_PER_CANDLE, INDICATOR_WINDOWS), 0, 0, 0, -1
 PORT, QR_countdown_timer, QR_TIMEOUT = 5000, 0, 30
+NEWS_URL, NEWS_TIMEOUT, NEWS_TTL, NEWS_PER_SOURCE = "https://www.bbc.com/news/world", 10, 6 * 3600, 10
+NEWS_SOURCES, news_cache = [('html', NEWS_URL)], {} # (html|rss|atom, url); lib/news-sources.txt can list more
+WATCH_WORDS_FILE, watch_matcher, watch_words_mtime = os.path.join(LIBDIR, 'watch-words.txt'), WatchMatcher(), None
+OPTIONS_FILE, options_mtime, CONFIG_PORT, CONFIG_POLL = os.path.join(LIBDIR, 'options.txt'), None, PORT + 1, 1.0
+FRAME_DIR = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir() # Frames for the options service's screenshot and stream
+FRAME_FILE, FRAME_TMP = os.path.join(FRAME_DIR, 'cryptopaper-frame.jpg'), os.path.join(FRAME_DIR, 'cryptopaper-frame.tmp.jpg')
+FRAME_ACK = os.path.join(FRAME_DIR, 'cryptopaper-frame.ack') # Touched when a viewer asks and the published frame is still the one shown
+FRAME_INTERVAL, VIEWER_TIMEOUT = 1.0, 5.0 # Publish at most once a second, and only while a viewer asked within the last few seconds
+viewer_seen, frame_published, frame_dirty, frame_acked = 0.0, 0.0, True, 0.0
+METRICS, METRICS_INTERVAL = Registry(), 5.0 # Telemetry for the options service's /metrics and /status, exported every few seconds
 
-BADGE = pygame.image.load(os.path.join(LIBDIR,'tryzub-100.png'))
 FONT_PATH = os.path.join(LIBDIR,"Code New Roman.otf")
 
 WAR_DAYS, WAR_KIT = 40, ['tank', 'apv', 'arty', 'mlrs', 'aa', 'jet', 'helo', 'drone', 'missile', 'truck']
+WAR_ICON_SCALE, BADGE, BADGE_SCALE = 0.18, 'tryzub-100', 0.6
+WAR_DATASET, WAR_TAIL_BYTES = "https://raw.githubusercontent.com/PetroIvaniuk/2022-Ukraine-Russia-War-Dataset/main/data/russia_losses_{}.json", 16384
+WAR_CACHE = os.path.join(CACHEDIR, 'war-stats.json')
+WEATHER_URL = "https://wttr.in/{}?0FQAT"
 KEY_MAP = {'APC': 'apv', 'field artillery': 'arty', 'MRL': 'mlrs', 'anti-aircraft warfare': 'aa', 'aircraft': 'jet', 'helicopter': 'helo', 'cruise missiles': 'missile', 'vehicles and fuel tanks': 'truck'}
 war_today_change, war_today_stats, orc_figures, war_day = [], [], [], 0
-
-last_update_day, last_update_hour = datetime.date.today(), 0
-
-BTC_INTERVAL, LTC_INTERVAL = 30, 60
+snapshot, snapshot_lock = {}, threading.Lock() # Latest results from the data sources, read by the render loop
+STATE_FILE, STATE_INTERVAL = os.path.join(CACHEDIR, 'state.json'), 60 # Last known state, shown at start while the sources refresh
+STATE_KEYS = ('btc_usd_spot', 'ltc_btc_rate', 'news', 'weather', 'orc_figures', 'war_day', 'war_today_stats', 'war_today_change', 'ip_addr')
+source_due, source_failures = {}, {} # Next run time of each data source, and how many times in a row it has failed
+SOURCE_RETRY, SOURCE_MAX_RETRY = 30, 900 # A failed source is retried after this, doubling each time up to the cap, or sooner if it is due anyway
+
+BTC_INTERVAL, LTC_INTERVAL, MAX_FETCHES = 30, 60, 4
+BITSTAMP_TICKER = "https://www.bitstamp.net/api/v2/ticker/{}"
+TICKERS = {'btcusd': BTC_INTERVAL, 'ltcbtc': LTC_INTERVAL} # Bitstamp pairs to poll, with their intervals in seconds
+BITSTAMP_STREAM, STREAM_STALE, STREAM_MAX_BACKOFF = option('stream-url', 'wss://ws.bitstamp.net'), 120, 60
+STREAMS = tuple(option('stream').split(',')) if isinstance(option('stream'), str) else ('btcusd',) if option('stream') else () # Pairs taken from live trades
+tickers, fetch_stats, streaming = {}, {}, set()
 
 try:
-    RESCALE_RESOLUTION = (int(sys.argv[1]), (int(sys.argv[1]) // 4) * 3)
+    RESCALE_RESOLUTION = (int(ARGS[0]), (int(ARGS[0]) // 4) * 3)
     if RESCALE_RESOLUTION[0] < 800: RESCALE_RESOLUTION = (800, 600) # WS-103 has width 1872 
 except: RESCALE_RESOLUTION = (WIN_W, WIN_H)
 
+HEADLESS, SINK_SPEC, PARTIAL = option('headless'), option('sink'), option('partial')
+HUB, CLIENT = option('hub'), option('client') # --hub[=socket] only runs the data engine and serves it to --client[=socket] displays
+HUB_SOCKET = next((value for value in (HUB, CLIENT) if isinstance(value, str)), os.path.join(FRAME_DIR, 'cryptopaper-hub.sock'))
+HUB_TIMEOUT, HUB_LIMIT = 5, 1 << 26 # Seconds a client may lag before it is dropped; longest message a client accepts
+METRICS_FILE = option('metrics', None if CLIENT else os.path.join(FRAME_DIR, 'cryptopaper-metrics.json')) # Clients have no options service to read it
+if HEADLESS or HUB: os.environ['SDL_VIDEODRIVER'] = 'dummy' # Render offscreen, without a window system
+if SINK_SPEC is True or (HEADLESS and SINK_SPEC is None): SINK_SPEC = 'pbm:' + os.path.join(CACHEDIR, 'frame.pbm')
+SINKS = [epaper.Sink(spec, partial = epaper.FrameDiff(full_every = epaper.FULL_EVERY if PARTIAL is True else int(PARTIAL)) if PARTIAL else None)
+    for spec in SINK_SPEC.split(',')] if SINK_SPEC else [] # Frames for e-paper drivers, written when they change
+LOG = sys.stderr if any(sink.path == '-' for sink in SINKS) else sys.stdout # Keep stdout clean when frames are piped through it
+
 pygame.init()
 rendered_display = pygame.display.set_mode( RESCALE_RESOLUTION, pygame.NOFRAME | pygame.DOUBLEBUF | pygame.HWSURFACE, 8 )
 pygame.display.set_caption(TITLE + ' ' + VERSION)
 pygame.mouse.set_visible(False)
-clock = pygame.time.Clock()
-display = pygame.Surface((WIN_W, WIN_H))
+DATA_EVENT, wake_pending = pygame.event.custom_type(), set() # Posted by the data thread when there is something new to draw, or a viewer wants a frame
+SMOOTHSCALE = option('smoothscale') # Draw at full size and rescale what changed, instead of drawing natively at the output size
+layout = Layout(1.0 if SMOOTHSCALE else RESCALE_RESOLUTION[0] / WIN_W) # Widgets draw in 2200x1650 design coordinates either way
+display = pygame.Surface((WIN_W, WIN_H) if layout.scale == 1.0 else RESCALE_RESOLUTION)
+ASSETS = Atlas(LIBDIR, scales = {**{kit: WAR_ICON_SCALE * layout.scale for kit in WAR_KIT}, BADGE: BADGE_SCALE * layout.scale}) # lib/*.png, scaled to their drawn size
 
 # Async functions
 def cancel_tasks_and_stop_loop(loop, tasks):
-    for task in tasks:
-        task.cancel()
-    loop.call_soon_threadsafe(loop.stop)
-
-async def get_btc_spot(timeout=TIMEOUT):
-    global btc_usd_spot
+    async def shutdown():
+        for task in tasks: task.cancel()
+        await asyncio.gather(*tasks, return_exceptions = True) # Let the tasks close their sessions
+        loop.stop()
+    asyncio.run_coroutine_threadsafe(shutdown(), loop)
+
+def record_fetch(endpoint: str, started: float, ok: bool, error: Exception = None, cached: bool = False):
+    elapsed = time.monotonic() - started
+    stats = fetch_stats.setdefault(endpoint, {'requests': 0, 'failures': 0, 'timeouts': 0, 'latency_ms': 0, 'total_ms': 0})
+    stats['requests'] += 1
+    stats['failures'] += not ok
+    stats['timeouts'] += timed_out(error)
+    stats['latency_ms'] = int(elapsed * 1000)
+    stats['total_ms'] += stats['latency_ms']
+    METRICS.observe('cryptopaper_fetch_seconds', elapsed, source = endpoint)
+    if not ok: METRICS.inc('cryptopaper_fetch_failures_total', source = endpoint)
+    if timed_out(error): METRICS.inc('cryptopaper_fetch_timeouts_total', source = endpoint)
+    if cached: METRICS.inc('cryptopaper_fetch_not_modified_total', source = endpoint)
+
+def timed_out(error: Exception) -> bool:
+    return isinstance(error, (asyncio.TimeoutError, socket.timeout)) or isinstance(getattr(error, 'reason', None), socket.timeout) # urllib wraps them
+
+def report_fetch_stats():
+    for endpoint, stats in fetch_stats.items():
+        notice('Fetches', f"{endpoint}: {stats['requests']} requests, {stats['failures']} failed ({stats['timeouts']} timed out), {stats['total_ms'] // max(stats['requests'], 1)}ms average, {stats['latency_ms']}ms last")
+
+async def fetch_ticker(session, pair: str, timeout = TIMEOUT):
+    started = time.monotonic()
     try:
-        async with aiohttp.ClientSession(timeout=ClientTimeout(total=timeout)) as session:
-            async with session.get("https://www.bitstamp.net/api/v2/ticker/btcusd") as response:
-                data = await response.json()
-                return float(data['last'])
-    except:
-        notice('BTC TIMEOUT', f"Using {str(btc_usd_spot)}")
-        return btc_usd_spot
+        async with session.get(BITSTAMP_TICKER.format(pair), timeout = ClientTimeout(total = timeout)) as response:
+            data = await response.json(content_type = None)
+            price = float(data['last'])
+    except Exception as e:
+        record_fetch(f'ticker/{pair}', started, False, e)
+        notice(f'{pair.upper()} TIMEOUT', f"Using {tickers.get(pair, 0)}")
+        return None
+    record_fetch(f'ticker/{pair}', started, True)
+    return price
+
+def update_ticker(pair: str, price: float, volume: float = 0.0, t: float = None):
+    global btc_usd_spot, ltc_btc_rate
+    if tickers.get(pair) != price: wake_render()
+    tickers[pair] = price
+    METRICS.set('cryptopaper_price_updated_seconds', CLOCK(), pair = pair)
+    if pair == 'btcusd':
+        btc_usd_spot = price
+        candle_store.add(price, volume, t)
+    elif pair == 'ltcbtc': ltc_btc_rate = price
+
+async def poll_tickers(session, stop_event, subscriptions: dict, concurrency: int = MAX_FETCHES):
+    # Poll each subscribed pair on its own interval through the shared session, with at most `concurrency` requests in flight
+    semaphore, in_flight, due = asyncio.Semaphore(concurrency), set(), {pair: 0 for pair in subscriptions}
+    next_report = time.monotonic() + STATS_INTERVAL
+
+    async def poll(pair):
+        async with semaphore:
+            price = await fetch_ticker(session, pair)
+        if price: update_ticker(pair, price)
+        in_flight.discard(pair)
 
-async def get_ltc_btc_rate(timeout=TIMEOUT):
-    global ltc_btc_rate
-    try:
-        async with aiohttp.ClientSession(timeout=ClientTimeout(total=timeout)) as session:
-            async with session.get("https://www.bitstamp.net/api/v2/ticker/ltcbtc") as response:
-                data = await response.json()
-                return float(data['last'])
-    except:
-        notice('LTC TIMEOUT', f"Using {ltc_btc_rate}")
-        return ltc_btc_rate
-
-async def update_btc_usd_spot(interval, stop_event):
-    global btc_usd_spot
     while not stop_event.is_set():
+        now = time.monotonic()
+        for pair, interval in subscriptions.items():
+            if pair in streaming: due[pair] = now + interval # Polling resumes as soon as the stream drops
+            elif due[pair] <= now and pair not in in_flight:
+                due[pair] = now + interval
+                in_flight.add(pair)
+                asyncio.ensure_future(poll(pair))
+        if now >= next_report:
+            next_report = now + STATS_INTERVAL
+            report_fetch_stats()
+        await asyncio.sleep(max(0.1, min(due.values()) - time.monotonic()))
+
+async def stream_trades(session, stop_event, pairs: tuple):
+    # Build candles from every trade on Bitstamp's live trade channels, reconnecting with exponential backoff
+    backoff = 1
+    while not stop_event.is_set():
+        started = time.monotonic()
         try:
-            btc_usd_spot = await asyncio.wait_for(get_btc_spot(), timeout=interval)
-        except asyncio.TimeoutError:
-            pass
+            async with session.ws_connect(BITSTAMP_STREAM, heartbeat = 30) as ws:
+                for pair in pairs: await ws.send_json({'event': 'bts:subscribe', 'data': {'channel': f'live_trades_{pair}'}})
+                while not stop_event.is_set():
+                    message = await ws.receive(timeout = STREAM_STALE)
+                    if message.type != aiohttp.WSMsgType.TEXT: break
+                    event = json.loads(message.data)
+                    pair = event.get('channel', '').rsplit('_', 1)[-1]
+                    if event.get('event') == 'bts:subscription_succeeded':
+                        record_fetch('stream', started, True)
+                        streaming.add(pair)
+                        backoff = 1
+                    elif event.get('event') == 'trade':
+                        trade = event['data']
+                        update_ticker(pair, float(trade['price']), float(trade['amount']), int(trade['microtimestamp']) / 1e6)
+                    elif event.get('event') == 'bts:request_reconnect': break
+        except asyncio.CancelledError: raise
         except Exception as e:
-            notice('Error', e)
-        await asyncio.sleep(interval)
+            record_fetch('stream', started, False, e)
+            notice('STREAM DOWN', f'{type(e).__name__}; polling instead, retrying in {backoff}s')
+        streaming.clear()
+        await asyncio.sleep(backoff)
+        backoff = min(backoff * 2, STREAM_MAX_BACKOFF)
+
+async def data_engine(stop_event, subscriptions: dict):
+    # One pooled, keep-alive session serves every fetch made on the asyncio thread; hub clients fetch nothing themselves
+    exporting = [export_metrics(stop_event)] if METRICS_FILE else []
+    if CLIENT: return await asyncio.gather(follow_hub(stop_event), watch_config(stop_event), *exporting)
+    connector = aiohttp.TCPConnector(limit = MAX_FETCHES, keepalive_timeout = 120, ttl_dns_cache = 3600)
+    async with aiohttp.ClientSession(connector = connector, timeout = ClientTimeout(total = TIMEOUT)) as session:
+        await asyncio.gather(poll_tickers(session, stop_event, subscriptions), poll_sources(stop_event), poll_news(session, stop_event), watch_config(stop_event), persist_state(stop_event),
+            *([stream_trades(session, stop_event, STREAMS)] if STREAMS else []), *([serve_hub(stop_event)] if HUB else []), *exporting)
+
+def run_asyncio_loop(loop, stop_event, shared_data, subscriptions: dict = TICKERS):
+    asyncio.set_event_loop(loop)
+    shared_data['tasks'].append(loop.create_task(data_engine(stop_event, subscriptions)))
+    loop.run_forever()
+    loop.close()
+
+# Hub and clients: one data engine feeding many displays over a Unix socket, as JSON lines of whatever changed
+def hub_state():
+    with snapshot_lock: state = dict(snapshot)
+    state.update(btc_usd_spot = btc_usd_spot, ltc_btc_rate = ltc_btc_rate)
+    return state
 
-async def update_ltc_btc_rate(interval, stop_event):
-    global ltc_btc_rate
+async def serve_hub(stop_event, path: str = HUB_SOCKET):
+    # New clients get the full state and candle history, then everyone gets the same encoded delta each second
+    clients, sent, sent_version, sent_candle = set(), {}, -1, 0.0
+
+    async def send(writer, line: bytes):
+        try:
+            writer.write(line)
+            await asyncio.wait_for(writer.drain(), HUB_TIMEOUT)
+        except (OSError, asyncio.TimeoutError):
+            clients.discard(writer)
+            writer.close()
+            notice('Hub', f'Dropped a client, {len(clients)} left')
+
+    async def connected(reader, writer):
+        clients.add(writer) # Before the first await, so no delta can slip between the full state and the next one
+        notice('Hub', f'Client connected, {len(clients)} in all')
+        await send(writer, json.dumps({'full': True, 'state': hub_state(), 'candles': candle_store.last().tolist()}).encode() + b'\n')
+
+    if os.path.exists(path): os.unlink(path) # Left over from a previous run
+    server = await asyncio.start_unix_server(connected, path)
+    notice('Hub', f'Serving {path}')
+    try:
+        while not stop_event.is_set():
+            await asyncio.sleep(1 - CLOCK() % 1)
+            if btc_usd_spot: candle_store.roll(CLOCK(), btc_usd_spot) # No render loop here to do it
+            state = hub_state()
+            encoded = {key: json.dumps(value) for key, value in state.items()}
+            delta = {key: state[key] for key, value in encoded.items() if sent.get(key) != value}
+            rows = []
+            if candle_store.version != sent_version:
+                sent_version, rows = candle_store.version, candle_store.last(2) # The open candle, and the one it replaced if that closed since
+                rows = rows[rows[:, T] >= sent_candle]
+                if len(rows): sent_candle = rows[-1, T]
+            if not (delta or len(rows)): continue
+            sent.update(encoded)
+            line = json.dumps({'state': delta, 'candles': rows.tolist() if len(rows) else []}).encode() + b'\n' # Encoded once for every client
+            await asyncio.gather(*(send(writer, line) for writer in list(clients)))
+    finally:
+        server.close()
+        for writer in clients: writer.close()
+        if os.path.exists(path): os.unlink(path)
+
+async def follow_hub(stop_event, path: str = HUB_SOCKET):
+    # Take prices, candles and everything else from a hub, reconnecting with backoff while it is away
+    global btc_usd_spot, ltc_btc_rate
+    backoff = 1
     while not stop_event.is_set():
         try:
-            ltc_btc_rate = await asyncio.wait_for(get_ltc_btc_rate(), timeout=interval)
-        except asyncio.TimeoutError:
-            pass
+            reader, writer = await asyncio.open_unix_connection(path, limit = HUB_LIMIT)
+            notice('Hub', f'Following {path}')
+            try:
+                while not stop_event.is_set():
+                    line = await reader.readline()
+                    if not line: break
+                    message = json.loads(line)
+                    state = message['state']
+                    if message['candles'] or message.get('full'): candle_store.merge(message['candles'], replace = message.get('full', False))
+                    btc_usd_spot, ltc_btc_rate = state.pop('btc_usd_spot', btc_usd_spot), state.pop('ltc_btc_rate', ltc_btc_rate)
+                    if message.get('full'): state['reload_chart'] = True
+                    publish(**state)
+                    backoff = 1
+            finally: writer.close()
+            notice('HUB DOWN', f'Hub closed the connection; retrying in {backoff}s')
+        except asyncio.CancelledError: raise
+        except (OSError, ValueError) as e: notice('HUB DOWN', f'{type(e).__name__}; retrying in {backoff}s')
+        await asyncio.sleep(backoff)
+        backoff = min(backoff * 2, STREAM_MAX_BACKOFF)
+
+# Data sources, run off the render thread
+def publish(**values):
+    with snapshot_lock:
+        changed = any(key not in snapshot or snapshot[key] != value for key, value in values.items())
+        snapshot.update(values)
+    if changed: wake_render()
+
+def wake_render(view: bool = False):
+    # Wake the render loop for new data, or to publish a frame for a viewer, with at most one event of each queued however fast they come.
+    # Low-power displays leave new data for their next frame, but still answer viewers
+    if view in wake_pending or HUB or (LOW_POWER and not view): return
+    wake_pending.add(view)
+    try: pygame.event.post(pygame.event.Event(DATA_EVENT, view = view))
+    except pygame.error: wake_pending.discard(view)
+
+def next_minute(now: float): return (now // 60 + 1) * 60
+
+def next_half_past(now: float):
+    # Weather runs halfway through the hour
+    due = datetime.datetime.fromtimestamp(now).replace(minute = 31, second = 0, microsecond = 0)
+    return (due if due.timestamp() > now else due + datetime.timedelta(hours = 1)).timestamp()
+
+def next_war_update(now: float):
+    # New stats are usually posted around midday so should most likely be there by 14:05
+    due = datetime.datetime.fromtimestamp(now).replace(hour = 14, minute = 5, second = 0, microsecond = 0)
+    return (due if due.timestamp() > now else due + datetime.timedelta(days = 1)).timestamp()
+
+def weather_source():
+    result = fetch_weather(1.0)
+    if '°' not in result: notice('WARNING',f'Weather missing.')
+    return {'weather': result}
+
+def war_source():
+    orc_figures, war_day, war_today_stats, war_today_change = fetch_orc_stats(WAR_DAYS, TIMEOUT * 2, use_cache = True)
+    return {'orc_figures': orc_figures, 'war_day': war_day, 'war_today_stats': war_today_stats, 'war_today_change': war_today_change}
+
+def address_source(): return {'ip_addr': ip_address()}
+
+def next_ten_minutes(now: float): return (now // 600 + 1) * 600
+
+SOURCES = {'weather': (weather_source, next_half_past), 'war': (war_source, next_war_update), 'address': (address_source, next_ten_minutes)} # name: (fetch, next due time)
+
+async def poll_sources(stop_event, sources: dict = SOURCES):
+    # Run each blocking source in the worker pool on its own cadence and publish what it returns to the snapshot
+    loop, in_flight = asyncio.get_running_loop(), set()
+
+    async def run(name, fetch):
+        started = time.monotonic()
+        try:
+            publish(**await loop.run_in_executor(None, fetch))
+            record_fetch(name, started, True)
+            source_failures.pop(name, None)
         except Exception as e:
-            notice('Error', e)
-        await asyncio.sleep(interval)
+            record_fetch(name, started, False, e)
+            failures = source_failures[name] = source_failures.get(name, 0) + 1
+            retry = min(SOURCE_RETRY * 2 ** (failures - 1), SOURCE_MAX_RETRY)
+            source_due[name] = min(source_due[name], CLOCK() + retry) # Not left for its next slot, which may be a day away
+            notice(f'{name.upper()} ERROR', f'{e}; retrying in {int(source_due[name] - CLOCK())}s')
+        in_flight.discard(name)
 
-def run_asyncio_loop(loop, stop_event, btc_interval, ltc_interval, shared_data):
-    asyncio.set_event_loop(loop)
-    btc_update_task = loop.create_task(update_btc_usd_spot(btc_interval, stop_event))
-    ltc_update_task = loop.create_task(update_ltc_btc_rate(ltc_interval, stop_event))
-    shared_data['tasks'].extend([btc_update_task, ltc_update_task])
-    loop.run_forever()
-    loop.close()
+    while not stop_event.is_set():
+        for name in due_sources(CLOCK(), sources, in_flight):
+            in_flight.add(name)
+            asyncio.ensure_future(run(name, sources[name][0]))
+        await asyncio.sleep(min(1.0, max(0.1, min(source_due[name] for name in sources) - CLOCK())))
+
+def due_sources(now: float, sources: dict = SOURCES, busy = ()):
+    # Names of the sources due at `now`, each rescheduled for its next run. Everything is due at once on start
+    due = []
+    for name, (_, next_due) in sources.items():
+        if source_due.setdefault(name, 0) <= now and name not in busy:
+            source_due[name] = next_due(now)
+            due.append(name)
+    return due
+
+def refresh_source(name: str): source_due[name] = 0 # Run a source on its next scheduler pass
+
+async def fetch_news_source(session, kind: str, url: str):
+    # Entries from one news source. Requests are conditional and bodies hashed, so unchanged sources are never parsed again.
+    state, started = news_cache.setdefault(url, {}), time.monotonic()
+    headers = {key: value for key, value in (('If-None-Match', state.get('etag')), ('If-Modified-Since', state.get('modified'))) if value}
+    try:
+        async with session.get(url, headers = headers, timeout = ClientTimeout(total = NEWS_TIMEOUT)) as response:
+            if response.status == 304:
+                record_fetch(f'news/{kind}', started, True, cached = True)
+                return state.get('entries', [])
+            response.raise_for_status()
+            data = await response.read()
+            state.update(etag = response.headers.get('ETag'), modified = response.headers.get('Last-Modified'))
+    except asyncio.CancelledError: raise
+    except Exception as e:
+        record_fetch(f'news/{kind}', started, False, e)
+        return state.get('entries', [])
+    record_fetch(f'news/{kind}', started, True)
+    digest = hashlib.sha1(data).digest()
+    if digest != state.get('digest'):
+        try: entries = [{'title': title, 'source': url} for title in extract_headlines(chunked(data), NEWS_PER_SOURCE)] if kind == 'html' else parse_feed(data, url, NEWS_PER_SOURCE)
+        except Exception:
+            notice('NEWS', f'Unreadable {kind} feed: {url}')
+            entries = []
+        state.update(digest = digest, entries = entries)
+    return state['entries']
+
+async def poll_news(session, stop_event):
+    # Poll every news source concurrently once a minute and publish a single ranked, deduplicated list of headlines
+    index = HeadlineIndex(NEWS_TTL)
+    while not stop_event.is_set():
+        results = await asyncio.gather(*(fetch_news_source(session, kind, url) for kind, url in NEWS_SOURCES))
+        ranked = rank_headlines([entry for entries in results for entry in entries], index, watch_matcher, now = CLOCK())
+        if ranked: publish(news = ranked)
+        elif not snapshot.get('news'): publish(news = ['', '', '  No headlines found']) # Otherwise keep what was restored or fetched before
+        source_due['news'] = next_minute(CLOCK())
+        while not stop_event.is_set() and CLOCK() < source_due['news']: await asyncio.sleep(0.5)
+
+class ConfigListener(asyncio.DatagramProtocol):
+    # The options service sends a datagram whenever it saves a file, and `view` while someone watches the screenshot or stream
+    def __init__(self, changed): self.changed = changed
+    def datagram_received(self, data, addr):
+        global viewer_seen
+        if data == b'view':
+            viewer_seen = time.time()
+            wake_render(view = True)
+        else: self.changed.set()
+
+async def watch_config(stop_event):
+    # Apply options and watch words saved from the options page (or edited by hand) to the running display, refreshing only what depends on them
+    changed = asyncio.Event()
+    try: transport, _ = await asyncio.get_running_loop().create_datagram_endpoint(lambda: ConfigListener(changed), local_addr = ('127.0.0.1', CONFIG_PORT))
+    except OSError:
+        transport = None
+        notice('NOTICE', f'Port {CONFIG_PORT} is in use; watching option files for changes instead')
+    try:
+        while not stop_event.is_set():
+            try: await asyncio.wait_for(changed.wait(), CONFIG_POLL)
+            except asyncio.TimeoutError: pass
+            changed.clear()
+            if file_mtime(OPTIONS_FILE) != options_mtime:
+                location = LOCATION
+                load_options()
+                if LOCATION != location: refresh_source('weather')
+                wake_render() # A new LTC threshold shows straight away
+            if file_mtime(WATCH_WORDS_FILE) != watch_words_mtime:
+                load_watch_list()
+                refresh_source('news') # Re-rank with the new watch words
+                wake_render()
+            ASSETS.check() # Replaced images are picked up by the render loop
+            if ASSETS.stale: wake_render()
+    finally:
+        if transport: transport.close()
+
+async def export_metrics(stop_event, path: str = METRICS_FILE):
+    # Write the registry for the options service every few seconds; it reads the file rather than asking this process
+    started, role = time.time(), 'hub' if HUB else 'client' if CLIENT else 'display'
+    while not stop_event.is_set():
+        try: METRICS.export(path, version = VERSION, role = role, host = socket.gethostname(), started = started, size = list(RESCALE_RESOLUTION))
+        except Exception as e: notice('NOTICE', f'Could not export metrics: {type(e).__name__}: {e}') # A broken collector must not take the data engine down with it
+        await asyncio.sleep(METRICS_INTERVAL)
+
+async def persist_state(stop_event):
+    # Keep the last known state on disk for the next start
+    while not stop_event.is_set():
+        await asyncio.sleep(STATE_INTERVAL)
+        try: save_state()
+        except OSError as e: notice('NOTICE', f'Could not save state: {e}')
 
 # Function to stop the asyncio loop from another thread
 def stop_asyncio_loop(loop): loop.call_soon_threadsafe(loop.stop)
 
 # Blocking functions
-def fetch_orc_stats(numDays = 40, timeout = TIMEOUT):
+def load_war_cache():
+    try:
+        with open(WAR_CACHE) as f: return json.load(f)
+    except (OSError, ValueError): return {}
+
+def save_war_cache(cache):
+    os.makedirs(CACHEDIR, exist_ok = True)
+    replace(WAR_CACHE, json.dumps(cache).encode())
+
+def load_state():
+    try:
+        with open(STATE_FILE) as f: state = json.load(f)
+    except (OSError, ValueError): return {}
+    return {key: value for key, value in state.items() if key in STATE_KEYS}
+
+def save_state():
+    os.makedirs(CACHEDIR, exist_ok = True)
+    replace(STATE_FILE, json.dumps({key: value for key, value in hub_state().items() if key in STATE_KEYS and value}).encode()) # Nothing yet is not worth keeping
+
+def tail_records(stream, count: int, partial: bool, chunk_size: int = 16384):
+    # Stream-decode the flat objects of a JSON array, keeping only the last `count`. A partial (ranged) body starts mid-record, so that is skipped.
+    decoder, utf8 = json.JSONDecoder(), codecs.getincrementaldecoder('utf-8')(errors = 'ignore')
+    records, buffer, aligned, eof = collections.deque(maxlen = count), '', not partial, False
+    while True:
+        if not aligned and '}' in buffer: buffer, aligned = buffer[buffer.index('}') + 1:], True
+        start = buffer.find('{') if aligned else -1
+        if start >= 0:
+            try:
+                record, end = decoder.raw_decode(buffer, start)
+                records.append(record)
+                buffer = buffer[end:]
+                continue
+            except json.JSONDecodeError: pass # Record is still arriving
+        elif aligned: buffer = ''
+        if eof: return list(records)
+        chunk = stream.read(chunk_size)
+        eof = not chunk
+        buffer += utf8.decode(chunk, final = eof)
+
+def fetch_dataset_tail(name: str, count: int, cache: dict, timeout = 60):
+    # Last `count` records of a war dataset. Requests are conditional and ranged, so an unchanged file costs a 304 and a changed one only its tail.
+    entry = cache.get(name, {})
+    for ranged in (True, False):
+        request = urllib.request.Request(WAR_DATASET.format(name))
+        if ranged: request.add_header('Range', f'bytes=-{WAR_TAIL_BYTES}')
+        if entry.get('etag'): request.add_header('If-None-Match', entry['etag'])
+        if entry.get('modified'): request.add_header('If-Modified-Since', entry['modified'])
+        try:
+            with urllib.request.urlopen(request, timeout = timeout) as response:
+                records = tail_records(response, count, response.status == 206)
+                headers = response.headers
+        except urllib.error.HTTPError as e:
+            if e.code == 304 and entry.get('records'): return entry['records']
+            raise
+        if len(records) >= count or not ranged: break # Otherwise the tail was too short; fetch the whole file
+    cache[name] = {'etag': headers.get('ETag'), 'modified': headers.get('Last-Modified'), 'records': records}
+    return records
+
+def fetch_orc_stats(numDays = 40, timeout = TIMEOUT, use_cache: bool = False):
 
     def calc_today_losses(dict_list):
         result = {}
@@ -118,91 +537,87 @@ def fetch_orc_stats(numDays = 40, timeout = TIMEOUT):
 
     def rename_keys(dict_list): return [{KEY_MAP.get(key, key): value for key, value in d.items()} for d in dict_list]
 
-    def fetch_orc_equipment(timeout = TIMEOUT):
-        global war_day, war_today_stats, war_today_change
-        with urllib.request.urlopen("https://raw.githubusercontent.com/PetroIvaniuk/2022-Ukraine-Russia-War-Dataset/main/data/russia_losses_equipment.json", timeout=60) as url:
-            js = json.loads(url.read())
-        war_day = js[-1]['day']
-        war_today_stats = rename_keys([js[-1]])
-        war_today_change = rename_keys(calc_today_losses(js[-2:]))
-        return
-
-    tally, daily = [], []
-    with urllib.request.urlopen("https://raw.githubusercontent.com/PetroIvaniuk/2022-Ukraine-Russia-War-Dataset/main/data/russia_losses_personnel.json", timeout=60) as url:
-        dict = json.loads(url.read())
-        for i in range(1, numDays + 2):
-            tally.insert(0, dict[0-i]['personnel'])
+    # Figures fetched since the last 14:05 update are reused as they are, so restarts download nothing
+    cache = load_war_cache()
+    if not (use_cache and cache.get('fetched', 0) >= next_war_update(CLOCK()) - 86400):
+        fetch_dataset_tail('personnel', numDays + 1, cache)
+        fetch_dataset_tail('equipment', 2, cache)
+        cache['fetched'] = CLOCK()
+        save_war_cache(cache)
+
+    tally = [record['personnel'] for record in cache['personnel']['records'][-(numDays + 1):]]
     daily = [int(tally[i+1]) - int(tally[i]) for i in range(len(tally)-1)]
-    fetch_orc_equipment()
+    js = cache['equipment']['records']
     
-    return(daily)
+    return(daily, js[-1]['day'], rename_keys([js[-1]]), rename_keys(calc_today_losses(js[-2:])))
     
 def fetch_weather(timeout = TIMEOUT):
-    wttr_url = f"https://wttr.in/{(LOCATION.replace(' ','_'))}?0FQAT"
+    wttr_url, started = WEATHER_URL.format(LOCATION.replace(' ','_')), time.monotonic()
     try:
         with urllib.request.urlopen(wttr_url, timeout=60) as url:
             data = url.read()
-    except:
+    except Exception as e:
+        record_fetch('wttr', started, False, e)
         notice('WTTR TIMEOUT', f'Using: {NL + weather}') 
         return weather
     result = data.decode()
+    record_fetch('wttr', started, '°' in result)
     if '°' not in result: 
         notice('WTTR EMPTY', f'Using: {NL + weather}') 
         return weather
     result = result.replace('\u2196','\u02f9').replace('\u2197','\u02fa').replace('\u2198','\u02fc').replace('\u2199','\u02fb') # Font shortcomings
-    return result + ' ' * 16 + f'({datetime.datetime.now().strftime("%H:%M")})'
-
-def fetch_bbc_news(headline_count=4, timeout=TIMEOUT):
-    # Return headline_count headline strings from BBC news
-    results = []
-    try:
-        with urllib.request.urlopen("https://www.bbc.com/news/world", timeout=timeout) as url:
-            data = url.read()
-    except:
-        return(['', '', '  No headlines found'])
-    soup = BeautifulSoup(data, 'html.parser')
-    headlines = soup.find('body').find_all('h2')
-
-    for i in range(len(headlines)):
-        if headlines[i].text.strip() not in results: results.append(f'{headlines[i].text.strip()}')
-        if len(results) >= headline_count: break
-
-    return results
+    return result + ' ' * 16 + f'({local_time("%H:%M")})'
 
-def get_btc_spot_once(timeout=TIMEOUT):
-    global btc_usd_spot
-    try:
-        with urllib.request.urlopen("https://www.bitstamp.net/api/v2/ticker/btcusd", timeout=timeout) as url:
-            data = json.loads(url.read())
-            return(float(data['last']))
-    except:
-        notice('BTC TIMEOUT', f"Using {str(btc_usd_spot)}")
-        return(btc_usd_spot)
+def get_font(font_size: int):
+    font_key = (FONT_PATH, font_size)
+    if font_key not in font_cache: font_cache[font_key] = pygame.font.Font(FONT_PATH, font_size)
+    return font_cache[font_key]
+
+def render_text(font_size: int, text: str, fg, bg):
+    # Reuse the rendered line while its text and colours are unchanged; cleared when the contrast changes
+    key = (FONT_PATH, font_size, text, fg, bg)
+    surface = text_cache.get(key)
+    if surface is not None:
+        text_cache.move_to_end(key)
+        text_stats['hits'] += 1
+        return surface
+    text_stats['misses'] += 1
+    surface = text_cache[key] = get_font(font_size).render(text, True, fg, bg)
+    if len(text_cache) > TEXT_CACHE_SIZE: text_cache.popitem(last = False)
+    return surface
 
 def print_at(canvas, text_x: int, text_y: int, text_string: str, font_size: int = 16, inverse: bool = False, align: int = 0):
-    global font_cache
-    font_key = (FONT_PATH, font_size)
-    font_cache.setdefault(font_key, pygame.font.Font(FONT_PATH, font_size))
-    font = font_cache[font_key]
+    # Positions and sizes are in design coordinates, as is the returned rect of the last line
+    font_size, (text_x, text_y) = layout.size(font_size), layout.point((text_x, text_y))
+    font = get_font(font_size)
 
     text_style, rect_style = (white, BLACK) if inverse else (BLACK, white)
     
     lines = text_string.split(NL)
     y_offset = 0
     for line in lines:
-        text = font.render(str(line), True, text_style, rect_style)
+        text = render_text(font_size, str(line), text_style, rect_style)
         text_rect = text.get_rect()
 
         if align == 1: # Center
-            text_rect.topleft = ((WIN_W // 2) - (text_rect.width // 2), text_y + y_offset)
+            text_rect.topleft = ((canvas.get_width() // 2) - (text_rect.width // 2), text_y + y_offset)
         elif align == 2: # Right
-            text_rect.topleft = (WIN_W - text_rect.width, text_y + y_offset)
+            text_rect.topleft = (canvas.get_width() - text_rect.width, text_y + y_offset)
         else: # Left (default)
             text_rect.topleft = (text_x, text_y + y_offset)
 
         canvas.blit(text, text_rect)
 
         y_offset += font.get_height()  # Increment Y offset by the font height for the next line
+    return layout.unscale(text_rect)
+
+def print_spans(canvas, text_x: int, text_y: int, text_string: str, font_size: int = 16, spans = ()):
+    # Print a single line with only the given (start, end) spans inverted
+    position = 0
+    for start, end in list(spans) + [(len(text_string), len(text_string))]:
+        for segment, inverse in ((text_string[position:start], False), (text_string[start:end], True)):
+            if segment: text_x = print_at(canvas, text_x, text_y, segment, font_size, inverse).right
+        position = end
 
 def ip_address():
     try:
@@ -212,7 +627,9 @@ def ip_address():
         ip = "(IP Timeout)"
     return ip
 
-def unix_minute(): return (int(time.time())//60) - T_START
+def unix_minute(): return (int(CLOCK())//60) - T_START
+
+def local_time(fmt: str): return time.strftime(fmt, time.localtime(CLOCK()))
 
 def coords_from_angle(radius, angle):
     # Calculate x,y coords for a point 'radius' distance from the origin along a path given by 'angle'
@@ -232,79 +649,154 @@ def ord_strftime(fmt, date_obj):
     ordinal_suffix = lambda n: "th" if 4 <= abs(n) % 100 <= 20 else {1: "st", 2: "nd", 3: "rd"}.get(abs(n) % 10, "th")
     return date_obj.strftime(fmt).replace('{S}', str(date_obj.day) + ordinal_suffix(date_obj.day))
 
-def display_image(canvas, image, x, y, rescale_factor: float = 1.0):
-    if rescale_factor != 1.0:
-        scaled_width = int(image.get_width() * rescale_factor)
-        scaled_height = int(image.get_height() * rescale_factor)
-        image = pygame.transform.scale(image, (scaled_width, scaled_height))
-    canvas.blit(image, image.get_rect().move(x, y))
-
 def draw_chart(canvas, left_x, top_y, data_list, col_width = 16):
     width = col_width * len(data_list) + 6
     height = 100
     box = pygame.Rect(left_x, top_y, width, height)
-    pygame.draw.rect(canvas, (0, 0, 0), box, 3)
+    layout.rect(canvas, (0, 0, 0), box, 3)
     top_gap = max(data_list) // 10
     for i in range(0, len(data_list)):
         y = fraction_of_range(data_list[i], 0, max(data_list)+top_gap, height)
-        pygame.draw.line(canvas, (0, 0, 0), (2+left_x + (i * col_width) + col_width//2,
+        layout.line(canvas, (0, 0, 0), (2+left_x + (i * col_width) + col_width//2,
                          top_y+height-2), (2+left_x + (i * col_width) + col_width//2, top_y+height-y), col_width-2)
 
-def notice(type: str = 'STATUS', content: str = ''): print(f"[{datetime.datetime.now().strftime('%b-%d %H:%M')}] {type}:  {content}")
+def notice(type: str = 'STATUS', content: str = ''): print(f"[{datetime.datetime.now().strftime('%b-%d %H:%M')}] {type}:  {content}", file = LOG, flush = True)
 
-def draw_equipment_losses(canvas, x, y, scale: float = 0.18):
+def draw_equipment_losses(canvas, x, y):
     offset = 0
-    for icon in WAR_KIT:
-        classification = icon
-        icon = pygame.image.load(os.path.join(LIBDIR,f'{icon}.png'))
-        display_image(canvas, icon, x + offset, y + 28, scale)
-        offset += int(450 * scale) + 4
-        print_at(canvas, (offset + 20) - int(450 * scale) + 32, y + 6, f"{war_today_change[0][classification]}", 24)
-    pygame.draw.rect(canvas, BLACK, pygame.Rect(x-4, y - 1, offset, 82), 3, 6)
-
-def draw_main_chart():
-    # Chart Frame
-    pygame.draw.rect(display, 0, pygame.Rect( 3, CHART_TOP - 10, WIN_W - 6, CHART_HEIGHT + 10), 6, 3 )
-
-    # Plot candles
-    plot_w = WIN_W // MAX_CANDLES # 3px
-    previous = CHART_HEIGHT - 1 # Bottom of chart
-    for i in range(len(candles)):
-        x = 8 + (i + 1 ) * plot_w
-        y = CHART_TOP + ( CHART_HEIGHT - fraction_of_range(candles[i], min(candles), max(candles), CHART_HEIGHT - 8) ) - 9
-        pygame.draw.circle(display, BLACK, (x, y), plot_w - 1, 0)
+    for classification in WAR_KIT:
+        ASSETS.blit(canvas, classification, *layout.point((x + offset, y + 28)))
+        offset += int(450 * WAR_ICON_SCALE) + 4
+        print_at(canvas, (offset + 20) - int(450 * WAR_ICON_SCALE) + 32, y + 6, f"{war_today_change[0][classification]}", 24)
+    layout.rect(canvas, BLACK, pygame.Rect(x-4, y - 1, offset, 82), 3, 6)
+
+class MainChart:
+    # Cached plot of the main chart. A new point scrolls the plot by one column and redraws only its neighbours;
+    # everything is replotted only when the window's high or low changes.
+    def __init__(self, points: int = CHART_POINTS):
+        self.window, self.plot_w, self.origin = RollingWindow(points), WIN_W // points, CHART_TOP - 10
+        self.low, self.high, self.version = 0, 0, 0
+        self.plot = pygame.Surface(layout.area((0, 0, WIN_W, CHART_HEIGHT + 10)).size)
+        self.plot.fill((255, 255, 255))
+        self.plot.set_colorkey((255, 255, 255))
+
+    def x_at(self, i): return 8 + (i + 1) * self.plot_w
+
+    def y_at(self, i): return CHART_TOP + ( CHART_HEIGHT - fraction_of_range(self.window[i], self.low, self.high, CHART_HEIGHT - 8) ) - 9
+
+    def plot_point(self, i):
+        plot_w, x, y = self.plot_w, self.x_at(i), self.y_at(i) - self.origin
+        layout.circle(self.plot, BLACK, (x, y), plot_w - 1, 0)
         # Draw a vertical line between jumps:
-        if (abs(y - previous) >= plot_w) and i > 0 and y < CHART_BOTTOM:
-            pygame.draw.line(display, BLACK, (x - plot_w + 1, previous - 1), (x - 1, y - 1), plot_w)
-        # Draw vertical grid line every 120 candles
-        if (i % 120 == 0) and i > 0: pygame.draw.line(display, BLACK, ( x + 6, CHART_TOP - 6 ), ( x + 6, CHART_BOTTOM - 1), 1 )
-
-        previous = y
-
-    # Draw horizontal marker for current price visibility
-    pygame.draw.line(display, BLACK, (x, y - 1), (WIN_W - 8, y - 1), 1)
+        previous = self.y_at(i - 1) - self.origin if i > 0 else 0
+        if (abs(y - previous) >= plot_w) and i > 0 and y + self.origin < CHART_BOTTOM:
+            layout.line(self.plot, BLACK, (x - plot_w + 1, previous - 1), (x - 1, y - 1), plot_w)
+
+    def replot(self):
+        self.plot.fill((255, 255, 255))
+        for i in range(len(self.window)): self.plot_point(i)
+
+    def load(self, values):
+        self.window = RollingWindow(self.window.capacity)
+        for value in values: self.window.push(value)
+        self.low, self.high, self.version = self.window.min, self.window.max, self.version + 1
+        self.replot()
+
+    def push(self, value):
+        self.version += 1
+        scrolling = self.window.full
+        self.window.push(value)
+        if (self.low, self.high) != (self.window.min, self.window.max):
+            self.low, self.high = self.window.min, self.window.max
+            return self.replot()
+        last = len(self.window) - 1
+        if scrolling and (self.plot_w * layout.scale).is_integer():
+            # Only whole-pixel steps can be scrolled; other scales replot, once per candle.
+            # Drawing is black-on-white, so neighbours that overlap the cleared strip can simply be redrawn whole
+            # (the first point also loses its connecting line, as the point it joined has scrolled off)
+            self.plot.scroll(-layout.size(self.plot_w), 0)
+            strip, height = self.x_at(last) - 2 * self.plot_w, CHART_HEIGHT + 10
+            layout.fill(self.plot, (255, 255, 255), pygame.Rect(strip, 0, WIN_W - strip, height))
+            layout.fill(self.plot, (255, 255, 255), pygame.Rect(0, 0, self.x_at(1), height))
+            for i in [0, 1, 2] + list(range(max(3, last - 3), last + 1)): self.plot_point(i)
+        elif scrolling: self.replot()
+        else: self.plot_point(last)
+
+    def amend(self, value):
+        # The newest point follows its candle until that closes: only its column is redrawn, unless the high or low moves
+        if not len(self.window) or self.window[-1] == value: return
+        self.version += 1
+        self.window.amend(value)
+        if (self.low, self.high) != (self.window.min, self.window.max):
+            self.low, self.high = self.window.min, self.window.max
+            return self.replot()
+        last = len(self.window) - 1
+        strip = self.x_at(last) - 2 * self.plot_w
+        layout.fill(self.plot, (255, 255, 255), pygame.Rect(strip, 0, WIN_W - strip, CHART_HEIGHT + 10))
+        for i in range(max(0, last - 2), last + 1): self.plot_point(i)
+
+    def draw(self, canvas):
+        # Chart Frame
+        layout.rect(canvas, 0, pygame.Rect( 3, CHART_TOP - 10, WIN_W - 6, CHART_HEIGHT + 10), 6, 3 )
+        if not len(self.window): return
+        layout.blit(canvas, self.plot, (0, self.origin))
+        # Draw vertical grid line every 120 points
+        for i in range(120, len(self.window), 120):
+            layout.line(canvas, BLACK, ( self.x_at(i) + 6, CHART_TOP - 6 ), ( self.x_at(i) + 6, CHART_BOTTOM - 1), 1 )
+        # Draw horizontal marker for current price visibility
+        x, y = self.x_at(len(self.window) - 1), self.y_at(-1)
+        layout.line(canvas, BLACK, (x, y - 1), (WIN_W - 8, y - 1), 1)
+
+main_chart = MainChart()
+
+def draw_main_chart(): main_chart.draw(display)
+
+def refresh_chart(reload: bool = False):
+    # Pull the active timeframe from the candle store into the main chart and the H/L and volatility figures.
+    # Within a bucket only the newest point moves, to the newest candle's close, without resampling
+    global chart_high, chart_low, chart_bucket, chart_version
+    if not reload and candle_store.version == chart_version: return
+    chart_version = candle_store.version
+    if not reload and len(candle_store):
+        newest = candle_store.last(1)[0]
+        if newest[T] // chart_timeframe * chart_timeframe == chart_bucket:
+            chart_high, chart_low = max(chart_high, newest[HIGH]), min(chart_low, newest[LOW])
+            return main_chart.amend(newest[CLOSE])
+    series = candle_store.series(chart_timeframe, CHART_POINTS)
+    if not len(series): return
+    chart_high, chart_low = series[:, HIGH].max(), series[:, LOW].min()
+    if reload: main_chart.load(series[:, CLOSE])
+    elif series[-1, T] != chart_bucket:
+        if len(series) > 1 and series[-2, T] == chart_bucket: main_chart.amend(series[-2, CLOSE]) # Its final close
+        main_chart.push(series[-1, CLOSE])
+    chart_bucket = series[-1, T]
+
+def volatility_pct():
+    if (chart_high - chart_low <= 0): return 0
+    return ((chart_high - chart_low) / chart_high) * 100
 
 def draw_volatility_indicator():
-    if (max(candles) - min(candles) <= 0): volatility = 0
-    else: volatility = ((max(candles) - min(candles)) / max(candles)) * 100
-    pygame.draw.circle(display, 0, VI_CENTER, VI_RADIUS, 5)
-    pygame.draw.circle(display, 0, VI_CENTER, min(volatility * VI_RATIO, VI_RADIUS) )
-    print_at(display, VI_CENTER[0] + VI_RADIUS - 16, CHART_BOTTOM + 4, f"${max(candles) - min(candles):,.0f}", 36)
+    volatility = volatility_pct()
+    layout.circle(display, 0, VI_CENTER, VI_RADIUS, 5)
+    layout.circle(display, 0, VI_CENTER, min(volatility * VI_RATIO, VI_RADIUS) )
+    print_at(display, VI_CENTER[0] + VI_RADIUS - 16, CHART_BOTTOM + 4, f"${chart_high - chart_low:,.0f}", 36)
     print_at(display, VI_CENTER[0] + VI_RADIUS - 12, WIN_H - 48, f"{volatility:,.2f}%", 48)
 
     # Movement Indicator Box
     MIB_H, MIB_W, MIB_BAR_H = 180, 48, 6
     MIB_X, MIB_Y = VI_CENTER[0] - 164, VI_CENTER[1] - (MIB_H // 2)
-    pygame.draw.rect(display, 0, pygame.Rect(MIB_X, MIB_Y, MIB_W, MIB_H), 5, 0)
-    value = fraction_of_range( btc_usd_spot, min(candles), max(candles), (MIB_H - 18) )
-    pygame.draw.rect(display, 0, pygame.Rect(MIB_X + 8, MIB_Y + (MIB_H - value) - (MIB_BAR_H * 2), MIB_W - 16, MIB_BAR_H), 0)
+    layout.rect(display, 0, pygame.Rect(MIB_X, MIB_Y, MIB_W, MIB_H), 5, 0)
+    value = fraction_of_range( btc_usd_spot, chart_low, chart_high, (MIB_H - 18) )
+    layout.rect(display, 0, pygame.Rect(MIB_X + 8, MIB_Y + (MIB_H - value) - (MIB_BAR_H * 2), MIB_W - 16, MIB_BAR_H), 0)
 
+def draw_second_hand():
     # Draw second hand for clock; white (not contrast-adaptive) if volatility indicator would otherwise obscure it.
-    (start_x, start_y) = coords_from_angle( int(VI_RADIUS * 0.6), int(time.strftime('%S')) * 6 )
-    (end_x, end_y) = coords_from_angle( int(VI_RADIUS * 1.0) - 8, int(time.strftime('%S')) * 6 )
-    pygame.draw.line(display, BLACK if volatility < 7 else (255,255,255), ( VI_CENTER[0] + start_x, VI_CENTER[1] + start_y ), ( VI_CENTER[0] + end_x, VI_CENTER[1] + end_y ), 3)
+    (start_x, start_y) = coords_from_angle( int(VI_RADIUS * 0.6), int(local_time('%S')) * 6 )
+    (end_x, end_y) = coords_from_angle( int(VI_RADIUS * 1.0) - 8, int(local_time('%S')) * 6 )
+    layout.line(display, BLACK if volatility_pct() < 7 else (255,255,255), ( VI_CENTER[0] + start_x, VI_CENTER[1] + start_y ), ( VI_CENTER[0] + end_x, VI_CENTER[1] + end_y ), 3)
 
 def draw_war_stats():
+    if not (orc_figures and war_today_change): return # Nothing fetched yet
     draw_chart(display, 16, CHART_BOTTOM + 94, orc_figures, CHART_COL_W)
     print_at(display, (WAR_DAYS * CHART_COL_W) + 34, CHART_BOTTOM + 118, f"{orc_figures[-1]}", 60)
     print_at(display, (WAR_DAYS * CHART_COL_W) + 36, CHART_BOTTOM + 98, f"High: {max(orc_figures)}", 16)
@@ -314,6 +806,7 @@ def draw_war_stats():
     draw_equipment_losses(display, 20, CHART_BOTTOM + 6)
 
 def generate_qr_code(url, size: int = 12):
+    # Drawn straight onto a surface, without a round trip through an image file
     qr = qrcode.QRCode(
         version = 1,
         error_correction = qrcode.constants.ERROR_CORRECT_H,
@@ -322,137 +815,244 @@ def generate_qr_code(url, size: int = 12):
     )
     qr.add_data(url)
     qr.make(fit = True)
-    img = qr.make_image(fill = BLACK, back_color = white)
-    img.save('qrcode.png')
-
-# Pygame main loop
-def pygame_loop(stop_event):
-    global news, candles, orc_figures, white, last_update_day, last_update_hour, weather, QR_countdown_timer
-    # Setup
-    ps = int(time.time())-1
-    previous_minute = 0
-    previous_tick = (int(time.time()) // SECS_PER_CANDLE) - 1
-    running = True
-    while running:
-        if (ps == int(time.time())):
-            clock.tick(FPS)
-            continue
-        else: ps = int(time.time())
-
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT: running = False
-            if event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_ESCAPE:
-                    running = False
-                elif (event.key == pygame.K_UP): # Contrast adjustment
-                    if white[0] < 255:  white = ( white[0] + 20, white[0] + 20, white[0] + 20)
-                elif (event.key == pygame.K_DOWN): # Contrast adjustments
-                    if white[0] > MIN_CONTRAST: white = ( white[0] - 20, white[0] - 20, white[0] - 20)
-                elif (event.key == pygame.K_SPACE): # Show options page QR code
-                    QR_countdown_timer = QR_TIMEOUT
-
+    matrix = qr.get_matrix()
+    surface = pygame.Surface((len(matrix) * size, len(matrix) * size))
+    surface.fill(white)
+    for y, row in enumerate(matrix):
+        for x, dark in enumerate(row):
+            if dark: surface.fill(BLACK, (x * size, y * size, size, size))
+    return surface
+
+# Widgets
+def draw_weather():
+    lines = weather.split(NL) # The first line stops short of the indicators beside it
+    print_at(display, 1176, CHART_BOTTOM + 38, NL.join([lines[0][:WEATHER_FIRST_LINE]] + lines[1:]), 22)
+
+def draw_clock():
+    layout.rect(display, BLACK, pygame.Rect(0, 0, WIN_W, 12))
+    print_at(display, 0, 12, local_time(' %H:%M '), 204, True)
+
+def draw_status():
+    print_at(display, WIN_W, CHART_BOTTOM + 9, f"{f'[{LOCATION}]' if any(char in string.digits for char in LOCATION) else LOCATION}   {ip_addr}  {(str((white[0] - MIN_CONTRAST) // 20) + '  ').replace('5 ','')}{timeframe_name() + '  ' if chart_timeframe != SECS_PER_CANDLE else ''}Up: {dhm(unix_minute() * 60)}  ", 24, False, 2)
+
+def timeframe_name(): return next(name for name, secs in TIMEFRAMES.items() if secs == chart_timeframe)
+
+def draw_version(): print_at(display, 1366, WIN_H - 16, VERSION, 16)
+
+def draw_date():
+    today = datetime.date.fromtimestamp(CLOCK())
+    print_at(display, WIN_W // 2, 22, today.strftime('%a') + ' ' + ord_strftime('{S}', today), 102, False, 1)
+    print_at(display, WIN_W // 2, 122, today.strftime('%b \'%y'), 90, False, 1)
+    layout.rect(display, BLACK, pygame.Rect(0, 215, WIN_W, 8))
+
+def headline_flags(): return [watch_matcher(headline) for headline in news]
+
+def draw_headlines():
+    # Watch words flash (inverted) every other second
+    news_size = 52
+    for i, headline in enumerate(news):
+        spans = [(start + 1, end + 1) for start, end in watch_matcher.spans(headline)] if int(CLOCK()) % 2 == 0 else []
+        print_spans(display, -16, 226 + ((news_size + 1) * i), ' ' + headline + ' ', news_size, spans)
+
+def btc_spot_text(): return f"${btc_usd_spot // 1000:,.0f}.{btc_usd_spot % 1000 // 100:.0f}K" if btc_usd_spot >= 100000 else f"${btc_usd_spot:,.0f}"
+
+def draw_btc_spot(): print_at(display, WIN_W, 12, btc_spot_text(), 204, True, 2)
+
+def draw_high_low():
+    layout.rect(display, white, pygame.Rect(WIN_W - 506, 226, 520, CHART_TOP - 10 - 226))
+    print_at(display, WIN_W, 227, f"H:${chart_high:,.0f}", 102, False, 2)  # BTC High
+    print_at(display, WIN_W, 343, f"L:${chart_low:,.0f}", 102, False, 2)  # BTC Low
+
+def draw_ltc():
+    print_at(display, WIN_W, WIN_H - 120, f"LTC:{ltc_btc_rate:,.4f}", 130, (ltc_btc_rate <= LTC_ALARM), 2)  # LTC
+    layout.rect(display, (ltc_btc_rate <= LTC_ALARM), (WIN_W - 162, WIN_H - 120 - 32 - 8, 162, 8))
+    print_at(display, WIN_W, WIN_H - 120 - 32, f"${(ltc_btc_rate * btc_usd_spot):.2f}".rjust(8) + ' ', 32, (ltc_btc_rate <= LTC_ALARM), 2) # LTC USD
+
+def indicator_text():
+    # Realized volatility over each indicator window, for as long as each has history
+    values = candle_store.indicator_values()
+    return 'Vol ' + ' '.join(f"{name}:{values[name]['volatility_pct']:.2f}%" for name in INDICATOR_WINDOWS if values.get(name, {}).get('candles', 0) > 1)
+
+def draw_indicators():
+    text = indicator_text()
+    print_at(display, INDICATOR_RECT.right - get_font(INDICATOR_FONT).size(text)[0], INDICATOR_RECT.top, text, INDICATOR_FONT)
+
+def draw_badge(): ASSETS.blit(display, BADGE, *layout.point((881, CHART_BOTTOM + 16)))
+
+def draw_qr_code():
+    # Show QR code for Options page if recently invoked
+    if QR_countdown_timer <= 0: return
+    ASSETS.blit(display, 'qr', *layout.point((WIN_W // 2 - 222, WIN_H // 2 - 222)))
+    print_at(display, WIN_W // 2 - 222, WIN_H // 2 - 222, f'http://{ip_addr}:{PORT}', 32)
+    print_at(display, WIN_W // 2 - 24, WIN_H // 2 + 200, f'{QR_countdown_timer - 1}s', 24)
+
+# (name, bounding rect, inputs, draw) in z-order; a widget is only redrawn when its inputs change
+# The indicators sit on the weather's first row, right-aligned against the LTC/USD label, as wide as the line can get
+INDICATOR_FONT = 22
+INDICATOR_W = get_font(INDICATOR_FONT).size('Vol ' + ' '.join(f'{name}:99.99%' for name in INDICATOR_WINDOWS))[0]
+INDICATOR_RECT = pygame.Rect(WIN_W - 162 - 12 - INDICATOR_W, CHART_BOTTOM + 38, INDICATOR_W, get_font(INDICATOR_FONT).get_height())
+WEATHER_FIRST_LINE = (INDICATOR_RECT.left - 1176) // get_font(22).size(' ')[0] - 1 # Characters of the weather's first line that fit beside them
+WIDGETS = [
+    ('weather', pygame.Rect(1176, CHART_BOTTOM + 38, WIN_W - 1176, WIN_H - CHART_BOTTOM - 38), lambda: weather, draw_weather),
+    ('clock', pygame.Rect(0, 0, WIN_W, 226), lambda: local_time('%H:%M'), draw_clock),
+    ('status', pygame.Rect(1176, CHART_BOTTOM + 6, WIN_W - 1176, 34), lambda: (LOCATION, ip_addr, unix_minute(), chart_timeframe), draw_status),
+    ('version', pygame.Rect(1366, WIN_H - 16, 120, 16), lambda: VERSION, draw_version),
+    ('date', pygame.Rect(0, 0, WIN_W, 226), lambda: datetime.date.fromtimestamp(CLOCK()), draw_date),
+    ('headlines', pygame.Rect(0, 226, WIN_W, CHART_TOP - 10 - 226), lambda: (tuple(news), watch_matcher.pattern, any(headline_flags()) and int(CLOCK()) % 2), draw_headlines),
+    ('indicators', INDICATOR_RECT, indicator_text, draw_indicators),
+    ('btc_spot', pygame.Rect(WIN_W // 2, 0, WIN_W // 2, 226), btc_spot_text, draw_btc_spot),
+    ('high_low', pygame.Rect(WIN_W - 506, 226, 506, CHART_TOP - 10 - 226), lambda: (chart_high, chart_low), draw_high_low),
+    ('ltc', pygame.Rect(WIN_W - 900, WIN_H - 160, 900, 160), lambda: (ltc_btc_rate, btc_usd_spot, LTC_ALARM), draw_ltc),
+    ('main_chart', pygame.Rect(0, CHART_TOP - 10, WIN_W, CHART_HEIGHT + 10), lambda: main_chart.version, draw_main_chart),
+    ('volatility', pygame.Rect(930, CHART_BOTTOM, 470, WIN_H - CHART_BOTTOM), lambda: (chart_high, chart_low, btc_usd_spot), draw_volatility_indicator),
+    ('second_hand', pygame.Rect(VI_CENTER[0] - VI_RADIUS, VI_CENTER[1] - VI_RADIUS, VI_RADIUS * 2, VI_RADIUS * 2), lambda: (local_time('%S'), volatility_pct() < 7), draw_second_hand),
+    ('war_stats', pygame.Rect(0, CHART_BOTTOM, 930, WIN_H - CHART_BOTTOM), lambda: (tuple(orc_figures), war_day, str(war_today_change), ASSETS.version), draw_war_stats),
+    ('badge', pygame.Rect(881, CHART_BOTTOM + 16, 40, 64), lambda: ASSETS.version, draw_badge),
+    ('qr_code', pygame.Rect(WIN_W // 2 - 222, WIN_H // 2 - 222, 520, 480), lambda: (QR_countdown_timer, ASSETS.version), draw_qr_code),
+]
+if not SECOND_HAND: WIDGETS = [widget for widget in WIDGETS if widget[0] != 'second_hand']
+FRAME_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+candle_tick, previous_white, qr_until = 0, None, 0 # Last candle bucket rolled, the contrast of the last frame, and when the QR code goes
+widget_inputs, frame_stats = {}, {'frames': 0, 'pixels': 0, 'last_pixels': 0, 'histogram': [0] * (len(FRAME_BUCKETS_MS) + 1), 'since': time.time(), 'text_hits': 0, 'text_misses': 0, 'first': None,
+    'wakeups': 0, 'cpu': time.process_time(), 'render_cpu': time.thread_time()}
+METRICS.histogram('cryptopaper_frame_seconds', 'Time to render and present a frame', [ms / 1000 for ms in FRAME_BUCKETS_MS])
+METRICS.counter('cryptopaper_frame_pixels_total', 'Output pixels redrawn')
+METRICS.counter('cryptopaper_widget_render_seconds_total', 'Time spent drawing each widget')
+METRICS.counter('cryptopaper_widget_renders_total', 'Times each widget was drawn')
+METRICS.histogram('cryptopaper_fetch_seconds', 'Latency of each data source, failures included', (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30))
+METRICS.counter('cryptopaper_fetch_failures_total', 'Failed fetches by source')
+METRICS.counter('cryptopaper_fetch_timeouts_total', 'Fetches by source that timed out')
+METRICS.counter('cryptopaper_fetch_not_modified_total', 'Fetches by source answered from cache with a 304')
+METRICS.gauge('cryptopaper_price_updated_seconds', 'Unix time of the last price for each pair')
+METRICS.gauge('cryptopaper_candles', 'Candles held in memory')
+METRICS.counter('cryptopaper_candle_gaps_total', 'Candles closed without a price sample')
+METRICS.counter('cryptopaper_text_cache_lookups_total', 'Text cache lookups by result')
+METRICS.gauge('cryptopaper_text_cache_lines', 'Rendered lines of text cached')
+METRICS.gauge('cryptopaper_memory_rss_bytes', 'Resident memory of the display process')
+METRICS.gauge('cryptopaper_memory_peak_rss_bytes', 'Peak resident memory of the display process')
+METRICS.gauge('cryptopaper_indicator', 'Rolling market indicators over each window: high, low, range_pct, sma, ema, volatility_pct, atr, vwap')
+METRICS.gauge('cryptopaper_first_frame_seconds', 'Time from launch to the first frame')
+METRICS.counter('cryptopaper_wakeups_total', 'Times the render loop woke, by what woke it: timer, data, view (a screenshot or stream viewer), or input (keys and window events)')
+METRICS.counter('cryptopaper_cpu_seconds_total', 'CPU time used by the whole process')
+METRICS.counter('cryptopaper_render_cpu_seconds_total', 'CPU time used by the render loop')
+
+def merge_rects(rects):
+    # Union any overlapping rects so that shared regions are only composited once
+    merged = []
+    for rect in rects:
+        rect = rect.clip((0, 0, WIN_W, WIN_H))
+        i = rect.collidelist(merged)
+        while i != -1:
+            rect.union_ip(merged.pop(i))
+            i = rect.collidelist(merged)
+        if rect.width and rect.height: merged.append(rect)
+    return merged
+
+def render_widgets(force: bool = False):
+    # Redraw the widgets whose inputs have changed, recompositing any overlapping neighbours in z-order. Returns the damaged rects.
+    damaged = []
+    for name, rect, inputs, _ in WIDGETS:
+        value = inputs()
+        if force or name not in widget_inputs or widget_inputs[name] != value:
+            widget_inputs[name] = value
+            damaged.append(rect)
+    damaged = merge_rects(damaged)
+    for area in damaged:
+        display.set_clip(layout.area(area))
         display.fill(white)
-        
-        # Show weather
-        print_at(display, 1176, CHART_BOTTOM + 38, weather, 22)
-
-        # Show clock
-        pygame.draw.rect(display, BLACK, pygame.Rect(0, 0, WIN_W, 12))
-        print_at(display, 0, 12, time.strftime(' %H:%M '), 204, True)
-
-        # Show status 
-        print_at(display, WIN_W, CHART_BOTTOM + 9, f"{f'[{LOCATION}]' if any(char in string.digits for char in LOCATION) else LOCATION}   {ip_addr}  {(str((white[0] - MIN_CONTRAST) // 20) + '  ').replace('5 ','')}Up: {dhm(unix_minute() * 60)}  ", 24, False, 2)
-        print_at(display, 1366, WIN_H - 16, VERSION, 16)
-
-        # Show date
-        today = datetime.date.today()
-        print_at(display, WIN_W // 2, 22, today.strftime('%a') + ' ' + ord_strftime('{S}', today), 102, False, 1)
-        print_at(display, WIN_W // 2, 122, today.strftime('%b \'%y'), 90, False, 1)
-        pygame.draw.rect(display, BLACK, pygame.Rect(0, 215, WIN_W, 8))
-
-        # Get spot price every candle
-        this_tick = int(time.time()) // SECS_PER_CANDLE
-        if this_tick > previous_tick:
-            previous_tick = this_tick
-            candles.append(btc_usd_spot)
-            if len(candles) > MAX_CANDLES: del candles[0]
-
-        this_hour = int(time.strftime('%H'))
-        # Once per minute tasks:
-        if (previous_minute != unix_minute()):
-            previous_minute = unix_minute()
-            news = fetch_bbc_news(4, 1.0)
-
-            # New stats are usually posted around midday so should most likely be there by 14:05 
-            if ( (last_update_day != today) and (datetime.datetime.now().time() > datetime.time(14, 5, 0)) ): 
-                last_update_day = datetime.date.today()
-                orc_figures = fetch_orc_stats(WAR_DAYS, TIMEOUT * 2)
-
-            # Once per hour tasks
-            if ( (last_update_hour != this_hour)):
-                if datetime.datetime.now().minute > 30: # Runs halfway through the hour
-                    last_update_hour = this_hour
-                    weather = fetch_weather(1.0)
-
-            if '°' not in weather: notice('WARNING',f'Weather missing.') 
-
-        # Show headlines
-        news_size = 52
-        for i in range(len(news)):
-            # Flashes (using boolean inverse argument) every other second if keyword found in headline
-            print_at(display, -16, 226 + ((news_size + 1) * i),
-                        ' ' + news[i] + ' ', news_size, any(kw.lower() in news[i].lower(
-                        ) for kw in WATCH_LIST) and (int(time.time()) % 2 == 0))
-
-        # Show BTC and LTC values
-        if btc_usd_spot >= 100000: print_at(display, WIN_W, 12, f"${btc_usd_spot // 1000:,.0f}.{btc_usd_spot % 1000 // 100:.0f}K", 204, True, 2)
-        else: print_at(display, WIN_W, 12, f"${btc_usd_spot:,.0f}", 204, True, 2)
-
-        pygame.draw.rect(display, white, pygame.Rect(WIN_W - 506, 226, 520, WIN_H - CHART_TOP))
-        print_at(display, WIN_W, 227, f"H:${max(candles):,.0f}", 102, False, 2)  # BTC High
-        print_at(display, WIN_W, 343, f"L:${min(candles):,.0f}", 102, False, 2)  # BTC Low
-
-        print_at(display, WIN_W, WIN_H - 120, f"LTC:{ltc_btc_rate:,.4f}", 130, (ltc_btc_rate <= LTC_ALARM), 2)  # LTC
-        pygame.draw.rect(display, (ltc_btc_rate <= LTC_ALARM), (WIN_W - 162, WIN_H - 120 - 32 - 8, 162, 8))
-        print_at(display, WIN_W, WIN_H - 120 - 32, f"${(ltc_btc_rate * btc_usd_spot):.2f}".rjust(8) + ' ', 32, (ltc_btc_rate <= LTC_ALARM), 2) # LTC USD
-
-        # Main chart
-        draw_main_chart()
-
-        # Show volatility indicator
-        draw_volatility_indicator()
-
-        # Show War Stats
-        draw_war_stats()
-
-        # Show badge
-        display_image(display, BADGE, 881, CHART_BOTTOM + 16, 0.6)
-
-        # Show QR code for Options page if recently invoked
-        if QR_countdown_timer > 0:
-            display_image(display, QR_image, WIN_W // 2 - 222, WIN_H // 2 - 222)
-            QR_countdown_timer -= 1
-            print_at(display, WIN_W // 2 - 222, WIN_H // 2 - 222, f'http://{ip_addr}:{PORT}', 32)
-            print_at(display, WIN_W // 2 - 24, WIN_H // 2 + 200, f'{QR_countdown_timer}s', 24)
-
-        # Render scaled frame
-        if(RESCALE_RESOLUTION != (WIN_W, WIN_H)): 
-            rescaled_display = pygame.transform.smoothscale(display, RESCALE_RESOLUTION)
-            rendered_display.blit(rescaled_display, (0, 0))
-        else: rendered_display.blit(display, (0, 0))
-        pygame.display.flip()
-
-        clock.tick(FPS)
+        for name, rect, _, draw in WIDGETS:
+            if not rect.colliderect(area): continue
+            started = time.perf_counter()
+            draw()
+            METRICS.inc('cryptopaper_widget_render_seconds_total', time.perf_counter() - started, widget = name)
+            METRICS.inc('cryptopaper_widget_renders_total', widget = name)
+    display.set_clip(None)
+    return damaged
+
+def present(damaged):
+    # Push only the damaged regions to the screen; with --smoothscale each region is rescaled rather than the whole canvas
+    if not damaged: return []
+    if display.get_size() == rendered_display.get_size(): # Drawn natively
+        updated = [layout.area(area).clip(display.get_rect()) for area in damaged]
+        for area in updated: rendered_display.blit(display, area, area)
+    else:
+        sx, sy = RESCALE_RESOLUTION[0] / WIN_W, RESCALE_RESOLUTION[1] / WIN_H
+        updated = []
+        for area in damaged:
+            left, top = int(area.left * sx), int(area.top * sy)
+            target = pygame.Rect(left, top, math.ceil(area.right * sx) - left, math.ceil(area.bottom * sy) - top)
+            rendered_display.blit(pygame.transform.smoothscale(display.subsurface(area), target.size), target)
+            updated.append(target)
+    pygame.display.update(updated)
+    return updated
+
+def publish_frame(updated):
+    # Encode the shown frame for the options service once per change, however many viewers there are, and not at all when nobody watches
+    global frame_published, frame_dirty, frame_acked
+    frame_dirty = frame_dirty or bool(updated)
+    now = time.time()
+    if not frame_dirty and viewer_seen > frame_acked: # Nothing new to encode, so tell the viewer the frame it has is current
+        try: open(FRAME_ACK, 'w').close()
+        except OSError as e: notice('NOTICE', f'Could not acknowledge viewer: {e}')
+        frame_acked = now
+    if not frame_dirty or now - viewer_seen > VIEWER_TIMEOUT or now - frame_published < FRAME_INTERVAL: return
+    try:
+        pygame.image.save(rendered_display, FRAME_TMP)
+        os.replace(FRAME_TMP, FRAME_FILE) # Readers never see a half-written frame
+    except (OSError, pygame.error) as e: notice('NOTICE', f'Could not publish frame: {e}')
+    frame_published, frame_dirty = now, False
+
+def count_frame(updated, frame_time: float):
+    frame_stats['frames'] += 1
+    frame_stats['last_pixels'] = sum(rect.width * rect.height for rect in updated)
+    frame_stats['pixels'] += frame_stats['last_pixels']
+    frame_stats['histogram'][bisect.bisect_left(FRAME_BUCKETS_MS, frame_time * 1000)] += 1
+    METRICS.observe('cryptopaper_frame_seconds', frame_time)
+    METRICS.inc('cryptopaper_frame_pixels_total', frame_stats['last_pixels'])
+    if frame_stats['first'] is None:
+        frame_stats['first'] = time.monotonic() - START_TIME
+        METRICS.set('cryptopaper_first_frame_seconds', frame_stats['first'])
+        notice('Startup', f"First frame {frame_stats['first']:.2f}s after launch")
+    if time.time() - frame_stats['since'] >= STATS_INTERVAL:
+        full = RESCALE_RESOLUTION[0] * RESCALE_RESOLUTION[1]
+        average = frame_stats['pixels'] // max(frame_stats['frames'], 1)
+        notice('Frames', f"{frame_stats['frames']} frames, {average:,} px/frame redrawn on average ({100 * average / full:.1f}% of full frame)")
+        hits, misses = text_stats['hits'] - frame_stats['text_hits'], text_stats['misses'] - frame_stats['text_misses'] # text_stats keep counting for the metrics
+        notice('Text cache', f"{hits:,} hits, {misses:,} misses ({100 * hits / max(hits + misses, 1):.1f}% hit rate), {len(text_cache)} lines cached")
+        elapsed, cpu, render_cpu = time.time() - frame_stats['since'], time.process_time() - frame_stats['cpu'], time.thread_time() - frame_stats['render_cpu']
+        notice('Scheduler', f"{frame_stats['wakeups'] * 60 / elapsed:.1f} wakeups/min, CPU {cpu * 3600 / elapsed:.1f}s/hour ({render_cpu * 3600 / elapsed:.1f}s/hour rendering)")
+        notice('Frame times', '  '.join(f"{label}: {count}" for label, count in zip([f'<={ms}ms' for ms in FRAME_BUCKETS_MS] + [f'>{FRAME_BUCKETS_MS[-1]}ms'], frame_stats['histogram']) if count))
+        for sink in SINKS:
+            if not sink.diff: continue
+            stats, updates = sink.diff.stats, max(sink.diff.stats['full'] + sink.diff.stats['partial'], 1)
+            notice('E-paper', f"{sink.kind}: {stats['full']} full and {stats['partial']} partial refreshes, {stats['changed'] // updates:,} px changed and {stats['refreshed'] // updates:,} px refreshed per update ({100 * stats['refreshed'] / updates / full:.1f}% of panel)")
+            stats.update(full = 0, partial = 0, changed = 0, refreshed = 0)
+        frame_stats.update(frames = 0, pixels = 0, histogram = [0] * (len(FRAME_BUCKETS_MS) + 1), since = time.time(), text_hits = text_stats['hits'], text_misses = text_stats['misses'],
+            wakeups = 0, cpu = time.process_time(), render_cpu = time.thread_time())
+
+def collect_metrics():
+    # Figures kept elsewhere, read just before each export
+    METRICS.set('cryptopaper_candles', len(candle_store))
+    METRICS.set('cryptopaper_candle_gaps_total', candle_store.gaps)
+    METRICS.set('cryptopaper_text_cache_lookups_total', text_stats['hits'], result = 'hit')
+    METRICS.set('cryptopaper_text_cache_lookups_total', text_stats['misses'], result = 'miss')
+    METRICS.set('cryptopaper_text_cache_lines', len(text_cache))
+    for window, values in candle_store.indicator_values().items():
+        for name, value in values.items():
+            if value is not None and name != 'candles': METRICS.set('cryptopaper_indicator', value, window = window, indicator = name)
+    try:
+        with open('/proc/self/statm') as f: METRICS.set('cryptopaper_memory_rss_bytes', int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE'))
+    except (OSError, ValueError): pass
+    METRICS.set('cryptopaper_memory_peak_rss_bytes', resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024)
+    METRICS.set('cryptopaper_cpu_seconds_total', time.process_time())
 
-    stop_event.set()
-    pygame.quit()
-   
-if __name__ == "__main__":
-    shared_data = {'tasks': []}
-    notice(TITLE,'Initialising...')
+METRICS.collect(collect_metrics)
 
+def load_options():
+    global LTC_ALARM, LOCATION, options_mtime
+    options_mtime = file_mtime(OPTIONS_FILE)
     try: 
-        with open(os.path.join(LIBDIR, 'options.txt'),'r') as f:
+        with open(OPTIONS_FILE,'r') as f:
             lines = f.readlines()
             line1, line2 = (''.join(c for c in line.strip() if c.isalnum() or c in " _-.,~'") for line in lines[:2]) # Sanitized
             LTC_ALARM = round(float(line1), 4)
@@ -460,45 +1060,175 @@ if __name__ == "__main__":
             notice('Options', f'Setting LTC threshold to : {LTC_ALARM}')
             notice('Options', f'Setting Location to `{LOCATION}`')
     except:
-        notice('NOTICE',"Options are defaulting. \nYou are seeing this notice because there's a problem with your " + (os.path.join(LIBDIR,'options.txt')) + " file. \nTo set your options, ensure that it exists, is readable and has some newline-separated values for LTC threshold and location.")
+        notice('NOTICE',"Options are defaulting. \nYou are seeing this notice because there's a problem with your " + OPTIONS_FILE + " file. \nTo set your options, ensure that it exists, is readable and has some newline-separated values for LTC threshold and location.")
         LTC_ALARM = 0.0040  # Below this ratio LTC display will be inverted
         LOCATION = 'New York' # For weather updates
 
-    # Load watch words. Ignore any words containing non-printable characters  
-    try: WATCH_LIST = [line.strip() for line in open(os.path.join(LIBDIR, 'watch-words.txt')) if all(char in string.printable for char in line)]
+def load_watch_list():
+    # Load watch words and compile them for matching. Ignore any words containing non-printable characters
+    global WATCH_LIST, watch_words_mtime
+    watch_words_mtime = file_mtime(WATCH_WORDS_FILE)
+    try: WATCH_LIST = [line.strip() for line in open(WATCH_WORDS_FILE) if all(char in string.printable for char in line)]
     except:
         notice('WARNING',"Watch word list is missing. \nYou are seeing this error because there's a problem with your {(os.path.join(LIBDIR,'watch-words.txt'))} file. Ensure that it exists, is readable and has some newline-separated watch words in it.")
         WATCH_LIST = ['breaking', 'shot', 'troop', 'explo', 'nuclear', 'chemical', 'Putin', 'killed', 'Moscow']
+    watch_matcher.compile(WATCH_LIST)
+
+def file_mtime(path: str):
+    try: return os.stat(path).st_mtime_ns
+    except OSError: return None
+
+def apply_snapshot():
+    # Take the latest published data for this frame
+    global news, weather, orc_figures, war_day, war_today_stats, war_today_change, ip_addr
+    with snapshot_lock:
+        news, weather = snapshot.get('news', news), snapshot.get('weather', weather)
+        orc_figures, war_day = snapshot.get('orc_figures', orc_figures), snapshot.get('war_day', war_day)
+        war_today_stats, war_today_change = snapshot.get('war_today_stats', war_today_stats), snapshot.get('war_today_change', war_today_change)
+        address = snapshot.get('ip_addr', ip_addr)
+        reload = snapshot.pop('reload_chart', False) # A hub client was sent the whole candle history
+    if reload: refresh_chart(reload = True)
+    if address != ip_addr or 'qr' not in ASSETS.generated:
+        ip_addr = address
+        ASSETS.add('qr', generate_qr_code(f'http://{ip_addr}:{PORT}'), layout.scale)
+        if ip_addr: notice(TITLE, f'Options service at http://{ip_addr}:{PORT}')
+
+def handle_events(events = None):
+    # Keys, window events and data wakeups, waiting ones by default; False once it is time to quit
+    global chart_timeframe, white, qr_until
+    running = True
+    for event in pygame.event.get() if events is None else events:
+        if event.type == pygame.QUIT: running = False
+        if event.type == DATA_EVENT: wake_pending.discard(event.view)
+        if event.type == pygame.KEYDOWN:
+            if event.key == pygame.K_ESCAPE:
+                running = False
+            elif (event.key == pygame.K_UP): # Contrast adjustment
+                if white[0] < 255:  white = ( white[0] + 20, white[0] + 20, white[0] + 20)
+            elif (event.key == pygame.K_DOWN): # Contrast adjustments
+                if white[0] > MIN_CONTRAST: white = ( white[0] - 20, white[0] - 20, white[0] - 20)
+            elif (event.key == pygame.K_SPACE): # Show options page QR code
+                qr_until = int(CLOCK()) + QR_TIMEOUT
+            elif (event.key == pygame.K_TAB): # Cycle chart timeframe
+                timeframes = list(TIMEFRAMES.values())
+                chart_timeframe = timeframes[(timeframes.index(chart_timeframe) + 1) % len(timeframes)]
+                refresh_chart(reload = True)
+    return running
+
+def frame(now: float):
+    # One update of the display at `now`: close the candle if its time is up, take the latest data and redraw what changed
+    global candle_tick, previous_white, QR_countdown_timer
+    frame_started = time.perf_counter()
+    this_tick = int(now) // SECS_PER_CANDLE
+    if this_tick > candle_tick:
+        if btc_usd_spot: # No price at all yet on a first ever start
+            # Frames can be further apart than a candle (up to an hour is filled in, e.g. after a suspend)
+            for tick in range(max(candle_tick + 1, this_tick - 3600 // SECS_PER_CANDLE) if candle_tick else this_tick, this_tick + 1): candle_store.roll(tick * SECS_PER_CANDLE, btc_usd_spot)
+        candle_tick = this_tick
+    refresh_chart() # Every new trade or price moves the newest point
+    QR_countdown_timer = max(0, qr_until - int(now))
+
+    apply_snapshot()
+
+    # Redraw changed widgets only; a contrast change repaints everything
+    if white != previous_white: text_cache.clear()
+    if ASSETS.stale: ASSETS.load()
+    updated = present(render_widgets(force = white != previous_white))
+    count_frame(updated, time.perf_counter() - frame_started)
+    publish_frame(updated)
+    if SINKS and updated: epaper.emit(SINKS, rendered_display)
+    previous_white = white
+    return updated
+
+def next_frame_time(now: float, last: float, data_waiting: bool = False):
+    # Each second for the second hand or the QR countdown, otherwise each minute (or --low-power interval).
+    # New data is drawn straight away, but no sooner than a second after the last frame
+    step = 1 if SECOND_HAND or QR_countdown_timer > 0 else LOW_POWER or 60
+    due = (now // step + 1) * step
+    return min(due, last + 1) if data_waiting else due
+
+# Pygame main loop
+def pygame_loop(stop_event):
+    # Sleep until there is something to draw: the next frame time, a key or new data from the data thread.
+    # A viewer of the screenshot or stream gets the frame already drawn, without waiting for the next one
+    running, last, data_waiting = True, 0.0, True # The first frame goes up straight away, whatever the mode
+    while running:
+        now = CLOCK()
+        due = next_frame_time(now, last, data_waiting)
+        event = pygame.event.wait(max(1, math.ceil((due - now) * 1000))) if due > now else pygame.event.Event(pygame.NOEVENT)
+        events = ([] if event.type == pygame.NOEVENT else [event]) + pygame.event.get()
+        running = handle_events(events)
+        keys = any(e.type == pygame.KEYDOWN for e in events)
+        data, view = (any(e.type == DATA_EVENT and e.view == kind for e in events) for kind in (False, True))
+        frame_stats['wakeups'] += 1
+        METRICS.inc('cryptopaper_wakeups_total', reason = 'timer' if not events else 'data' if data else 'view' if view else 'input')
+        METRICS.set('cryptopaper_render_cpu_seconds_total', time.thread_time())
+        data_waiting, now = data_waiting or data, CLOCK()
+        if keys or now >= due or (data_waiting and now >= last + 1):
+            frame(now)
+            last, data_waiting = now, False
+        elif view and last: publish_frame([])
+
+    stop_event.set()
+    pygame.quit()
+   
+if __name__ == "__main__":
+    shared_data = {'tasks': []}
+    notice(TITLE,'Initialising...')
+
+    load_options()
+
+    # Extra news sources, one `html|rss|atom url` per line
+    try:
+        with open(os.path.join(LIBDIR, 'news-sources.txt')) as f:
+            NEWS_SOURCES = [tuple(words) for words in (line.split() for line in f if not line.startswith('#')) if len(words) == 2 and words[0] in ('html', 'rss', 'atom')] or NEWS_SOURCES
+            notice('Options', f'{len(NEWS_SOURCES)} news sources')
+    except OSError: pass
+
+    load_watch_list()
  
-    btc_usd_spot = get_btc_spot_once(BTC_INTERVAL)
-    while btc_usd_spot == 0:
-        notice(TITLE, 'Please wait...')
-        btc_usd_spot = get_btc_spot_once(BTC_INTERVAL)
-        time.sleep(BTC_INTERVAL // 2)
-    news = fetch_bbc_news(4)
-    weather = fetch_weather()
-    last_update_hour = int(time.strftime('%H'))
-    orc_figures = fetch_orc_stats(WAR_DAYS, TIMEOUT*2)
-    ip_addr = ip_address()
-    generate_qr_code(f'http://{ip_addr}:{PORT}')
-    QR_image = pygame.image.load('qrcode.png')
+    candle_log = None
+    if CLIENT: notice(TITLE, f'Rendering from the hub at {HUB_SOCKET}')
+    else:
+        # Restore candle history from the previous run; the last close stands in for spot until the first fetch
+        candle_log = CandleLog(CACHEDIR, STORE_CANDLES)
+        notice('Candles', f'Restored {candle_store.attach(candle_log)} candles from {CACHEDIR}')
+        if len(candle_store): btc_usd_spot = candle_store.last(1)[0, CLOSE]
+        refresh_chart(reload = True)
+
+    # Show the last known state straight away; prices, news, weather, war figures and the address all refresh together once the data engine starts
+    state = load_state()
+    btc_usd_spot, ltc_btc_rate = state.pop('btc_usd_spot', btc_usd_spot), state.pop('ltc_btc_rate', ltc_btc_rate)
+    publish(**state)
+    apply_snapshot()
+    notice('State', f'Restored {", ".join(state)} from {STATE_FILE}' if state else 'No saved state; filling in as the sources reply')
     
     if RESCALE_RESOLUTION != (WIN_W, WIN_H): notice('Rescaling',str(RESCALE_RESOLUTION))
 
-    notice(TITLE, 'Launching options service at ' + f'http://{ip_addr}:{PORT}' + ' ...')
-    p = subprocess.Popen(['python','options.py'])
+    if not CLIENT: # Clients are configured through the hub's options service
+        notice(TITLE, f'Launching options service on port {PORT} ...')
+        p = subprocess.Popen(['python','options.py'], stdout = LOG)
 
     notice(TITLE, 'Started')
     loop = asyncio.new_event_loop()
     stop_event = threading.Event()
     
-    asyncio_thread = threading.Thread(target=run_asyncio_loop, args=(loop, stop_event, BTC_INTERVAL, LTC_INTERVAL, shared_data))
+    asyncio_thread = threading.Thread(target=run_asyncio_loop, args=(loop, stop_event, shared_data))
     asyncio_thread.start()
 
-    # Run the Pygame loop in the main thread
-    pygame_loop(stop_event)
+    # Run the Pygame loop in the main thread; a hub has nothing to draw, and no event queue to see SDL's quit on SIGTERM
+    if HUB:
+        signal.signal(signal.SIGTERM, lambda signum, frame: stop_event.set())
+        try:
+            while asyncio_thread.is_alive() and not stop_event.is_set(): asyncio_thread.join(1)
+        except KeyboardInterrupt: stop_event.set()
+    else: pygame_loop(stop_event)
 
     # Stop the asyncio loop and clean up
     cancel_tasks_and_stop_loop(loop, shared_data['tasks'])
     asyncio_thread.join()
+    if not CLIENT:
+        try: save_state()
+        except OSError as e: notice('NOTICE', f'Could not save state: {e}')
+    if candle_log: candle_log.close()
     notice(TITLE, 'Ended')
@@ -0,0 +1,137 @@
+# Cryptopaper e-paper output: quantize rendered frames to a panel's bit depth and hand them to sinks
+import os, sys, tempfile, time
+import numpy as np
+import pygame
+from files import replace
+
+BAYER = np.array([[0, 8, 2, 10], [12, 4, 14, 6], [3, 11, 1, 9], [15, 7, 13, 5]], dtype = np.uint32) # 4x4 ordered dither matrix
+_offsets = {} # Tiled dither offsets by frame shape
+DEPTHS = {'png': 8, 'pbm': 1, 'raw1': 1, 'raw4': 4} # Bits per pixel of each sink format
+TILE = 32 # Partial refresh granularity in pixels
+FULL_EVERY, FULL_AREA, FULL_INTERVAL = 60, 0.5, 3600 # Full refresh after this many partial ones, above this fraction of the panel changed, or this many seconds
+
+def luma(surface) -> np.ndarray:
+    # (height, width) array of 0-255 grey levels; 8-bit palette surfaces are looked up without converting to RGB
+    if surface.get_bitsize() == 8:
+        palette = np.array([c[:3] for c in surface.get_palette()], dtype = np.uint32)
+        lut = ((palette @ np.array([77, 150, 29], dtype = np.uint32)) >> 8).astype(np.uint8)
+        return lut[pygame.surfarray.pixels2d(surface).T]
+    r, g, b = (channel(surface).T for channel in (pygame.surfarray.pixels_red, pygame.surfarray.pixels_green, pygame.surfarray.pixels_blue))
+    return ((r * np.uint16(77) + g * np.uint16(150) + b * np.uint16(29)) >> 8).astype(np.uint8)
+
+def quantize(grey: np.ndarray, bits: int) -> np.ndarray:
+    # Ordered-dither grey levels down to 2**bits levels (0 = black); pure black and white stay exact.
+    # Integer form of floor(grey * top / 255 + (bayer + 0.5) / 16)
+    if bits >= 8: return grey
+    top = (1 << bits) - 1
+    h, w = grey.shape
+    if grey.shape not in _offsets: _offsets[grey.shape] = np.tile((2 * BAYER + 1) * 255, (h // 4 + 1, w // 4 + 1))[:h, :w]
+    return ((grey * np.uint32(top * 32) + _offsets[grey.shape]) // 8160).astype(np.uint8)
+
+def pack(levels: np.ndarray, kind: str) -> bytes:
+    # Panel-ready bytes: rows are padded to whole bytes, most significant bits first
+    h, w = levels.shape
+    if kind == 'pbm': return b'P4\n%d %d\n' % (w, h) + np.packbits(levels == 0, axis = 1).tobytes() # PBM marks black pixels
+    if kind == 'raw1': return np.packbits(levels, axis = 1).tobytes() # 1 = white
+    if kind == 'raw4':
+        if w % 2: levels = np.pad(levels, ((0, 0), (0, 1)))
+        return (levels[:, 0::2] << 4 | levels[:, 1::2]).tobytes() # Two pixels per byte, 15 = white
+    raise ValueError(f'Unknown frame format `{kind}`')
+
+def tile_rects(tiles: np.ndarray, tile: int, width: int, height: int):
+    # Merge a grid of changed tiles into rectangles: runs along each tile row, grown downwards while the row below has the same run
+    growing, rects = {}, []
+    for row in range(tiles.shape[0]):
+        cols = np.flatnonzero(tiles[row])
+        breaks = np.flatnonzero(np.diff(cols) > 1)
+        runs = set(zip(cols[np.r_[0, breaks + 1]], cols[np.r_[breaks, len(cols) - 1]] + 1)) if len(cols) else set()
+        for run in runs:
+            if run in growing: growing[run][3] += 1
+            else: growing[run] = [run[0], row, run[1] - run[0], 1]
+        for run in [run for run in growing if run not in runs]: rects.append(growing.pop(run))
+    rects += growing.values()
+    return [pygame.Rect(x * tile, y * tile, w * tile, h * tile).clip((0, 0, width, height)) for x, y, w, h in rects]
+
+class FrameDiff:
+    # Compares each frame with the last one sent to the panel, in tiles, and picks a partial or full refresh.
+    # Full refreshes clear e-paper ghosting but flash the panel, so they are spread out by count and time
+    def __init__(self, tile: int = TILE, full_every: int = FULL_EVERY, full_area: float = FULL_AREA, full_interval: float = FULL_INTERVAL):
+        self.tile, self.full_every, self.full_area, self.full_interval = tile, full_every, full_area, full_interval
+        self.last, self.partials, self.last_full = None, 0, 0.0
+        self.stats = {'full': 0, 'partial': 0, 'changed': 0, 'refreshed': 0, 'last_changed': 0}
+
+    def changed_tiles(self, levels: np.ndarray) -> np.ndarray:
+        t, (h, w) = self.tile, levels.shape
+        diff = np.bitwise_xor(levels, self.last)
+        if h % t or w % t: diff = np.pad(diff, ((0, -h % t), (0, -w % t)))
+        return diff.reshape(diff.shape[0] // t, t, diff.shape[1] // t, t).any(axis = (1, 3))
+
+    def update(self, levels: np.ndarray, now: float = None):
+        # ('full' | 'partial', rects), or (None, []) when nothing changed; the frame is then remembered as sent
+        now = time.time() if now is None else now
+        h, w = levels.shape
+        if self.last is None or self.last.shape != levels.shape: mode, rects, changed = 'full', [], w * h
+        else:
+            tiles = self.changed_tiles(levels)
+            if not tiles.any(): return None, []
+            rects = tile_rects(tiles, self.tile, w, h)
+            changed = sum(rect.width * rect.height for rect in rects)
+            due = self.partials >= self.full_every or now - self.last_full >= self.full_interval
+            mode = 'full' if due or changed >= self.full_area * w * h else 'partial'
+        if mode == 'full': rects, self.partials, self.last_full = [pygame.Rect(0, 0, w, h)], 0, now
+        else: self.partials += 1
+        self.last = levels # Each frame's levels are a fresh array, so no copy is needed
+        self.stats[mode] += 1
+        self.stats['changed'] += changed
+        self.stats['refreshed'] += sum(rect.width * rect.height for rect in rects)
+        self.stats['last_changed'] = changed
+        return mode, rects
+
+class Sink:
+    # Where frames go, from a `kind[:path]` spec such as `pbm:/dev/shm/panel.pbm` or `raw4:-` for stdout.
+    # With partial refresh, each frame comes with a header of `full|partial <count>` and `x y w h` lines:
+    # ahead of the frame on stdout, or in a `.rects` file beside it
+    def __init__(self, spec: str, default_path: str = '-', partial: FrameDiff = None):
+        self.kind, _, self.path = spec.partition(':')
+        if self.kind not in DEPTHS: raise ValueError(f'Unknown frame format `{self.kind}`, expected one of {", ".join(DEPTHS)}')
+        self.path, self.bits, self.last, self.frames = self.path or default_path, DEPTHS[self.kind], None, 0
+        self.diff = partial
+        # PNGs are encoded through a file: pygame 2.3 leaks a few KB on every save into a file object
+        self.scratch = os.path.join(tempfile.gettempdir(), f'cryptopaper-{os.getpid()}.png') if self.path == '-' else self.path + '.tmp.png'
+
+    def encode(self, surface, levels) -> bytes:
+        if self.kind != 'png': return pack(levels, self.kind)
+        pygame.image.save(surface, self.scratch)
+        with open(self.scratch, 'rb') as f: data = f.read()
+        if self.path == '-': os.remove(self.scratch)
+        return data
+
+    def send(self, surface, levels) -> bool:
+        if self.diff:
+            mode, rects = self.diff.update(levels)
+            if not mode: return False
+            header = f'{mode} {len(rects)}\n'.encode() + b''.join(b'%d %d %d %d\n' % tuple(rect) for rect in rects)
+        data = self.encode(surface, levels)
+        if not self.diff:
+            if data == self.last: return False # Dithering can hide small changes
+            header, self.last = b'', data
+        if self.path == '-':
+            sys.stdout.buffer.write(header + data)
+            sys.stdout.buffer.flush()
+        else:
+            if self.kind == 'png': os.replace(self.scratch, self.path) # Already written out by encode
+            else: replace(self.path, data)
+            if header: replace(self.path + '.rects', header)
+        self.frames += 1
+        return True
+
+def emit(sinks, surface):
+    # Quantize once per bit depth and feed every sink; returns how many sinks took a new frame
+    grey, levels = None, {}
+    written = 0
+    for sink in sinks:
+        if (sink.bits < 8 or sink.diff) and sink.bits not in levels:
+            if grey is None: grey = luma(surface)
+            levels[sink.bits] = quantize(grey, sink.bits)
+        written += sink.send(surface, levels.get(sink.bits))
+    return written
@@ -0,0 +1,7 @@
+# Cryptopaper files: writes that readers in other processes (panel drivers, the options service, the next start) can rely on
+import os
+
+def replace(path: str, data: bytes):
+    # Write to a temporary file beside `path` and move it into place, so readers never see a half-written file
+    with open(path + '.tmp', 'wb') as f: f.write(data)
+    os.replace(path + '.tmp', path)
@@ -0,0 +1,132 @@
+# Cryptopaper headline extraction and aggregation
+from html.parser import HTMLParser
+from collections import OrderedDict
+from email.utils import parsedate_to_datetime
+import xml.etree.ElementTree as ElementTree
+import codecs, datetime, hashlib, heapq, re, time
+
+class _Enough(Exception): pass
+
+class HeadlineParser(HTMLParser):
+    # Collects the text of <h2> elements inside <body>, giving up on the rest of the page once `count` unique headlines are found
+    def __init__(self, count: int):
+        super().__init__()
+        self.count, self.headlines, self.in_body, self.parts = count, [], False, None
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'body': self.in_body = True
+        elif tag == 'h2' and self.in_body: self.parts = []
+
+    def handle_data(self, data):
+        if self.parts is not None: self.parts.append(data)
+
+    def handle_endtag(self, tag):
+        if tag != 'h2' or self.parts is None: return
+        headline, self.parts = ''.join(self.parts).strip(), None
+        if headline not in self.headlines: self.headlines.append(headline)
+        if len(self.headlines) >= self.count: raise _Enough
+
+def extract_headlines(chunks, count: int = 4, encoding: str = 'utf-8'):
+    # Feed an iterable of byte chunks through the parser, stopping as soon as there are enough headlines
+    parser, decoder = HeadlineParser(count), codecs.getincrementaldecoder(encoding)(errors = 'replace')
+    try:
+        for chunk in chunks: parser.feed(decoder.decode(chunk))
+        parser.feed(decoder.decode(b'', final = True))
+        parser.close()
+    except _Enough: pass
+    return parser.headlines
+
+def chunked(data: bytes, size: int = 16384): return (data[i:i + size] for i in range(0, len(data), size))
+
+def soup_headlines(data: bytes, count: int = 4):
+    # The original full-tree BeautifulSoup extraction, kept for comparison
+    from bs4 import BeautifulSoup
+    results = []
+    for headline in BeautifulSoup(data, 'html.parser').find('body').find_all('h2'):
+        if headline.text.strip() not in results: results.append(headline.text.strip())
+        if len(results) >= count: break
+    return results
+
+ATOM = '{http://www.w3.org/2005/Atom}'
+
+def parse_time(text):
+    # RSS (RFC 822) or Atom (ISO 8601) timestamp as a unix time, or None
+    if not text: return None
+    try: return parsedate_to_datetime(text).timestamp()
+    except (TypeError, ValueError):
+        try: return datetime.datetime.fromisoformat(text.strip().replace('Z', '+00:00')).timestamp()
+        except ValueError: return None
+
+def parse_feed(data: bytes, source: str, limit: int = 20):
+    # Normalised entries from an RSS or Atom document
+    root, entries = ElementTree.fromstring(data), []
+    for item in (root.iter('item') if root.tag != f'{ATOM}feed' else root.iter(f'{ATOM}entry')):
+        if root.tag == f'{ATOM}feed':
+            link = item.find(f'{ATOM}link')
+            title, link, published = item.findtext(f'{ATOM}title'), link.get('href') if link is not None else '', item.findtext(f'{ATOM}updated') or item.findtext(f'{ATOM}published')
+        else: title, link, published = item.findtext('title'), item.findtext('link'), item.findtext('pubDate')
+        if title and title.strip(): entries.append({'title': ' '.join(title.split()), 'link': (link or '').strip(), 'published': parse_time(published), 'source': source})
+        if len(entries) >= limit: break
+    return entries
+
+class HeadlineIndex:
+    # Hashed seen-set of headlines, ordered by when each was last seen so expired ones are evicted from the front
+    def __init__(self, ttl: float):
+        self.ttl, self.seen = ttl, OrderedDict() # key: [first seen, last seen]
+
+    @staticmethod
+    def key(title: str): return hashlib.blake2b(' '.join(title.split()).casefold().encode(), digest_size = 8).digest()
+
+    def touch(self, key, now: float):
+        # Mark a headline as seen; returns when it was first seen
+        times = self.seen.get(key)
+        if times: 
+            times[1] = now
+            self.seen.move_to_end(key)
+        else: times = self.seen[key] = [now, now]
+        return times[0]
+
+    def evict(self, now: float):
+        while self.seen and next(iter(self.seen.values()))[1] < now - self.ttl: self.seen.popitem(last = False)
+
+def rank_headlines(entries, index: HeadlineIndex, watched, count: int = 4, now: float = None):
+    # Dedupe the entries from every source and order them watched-first, then newest first. Undated entries date from when they were first seen.
+    now, current = time.time() if now is None else now, {}
+    for entry in entries:
+        key = index.key(entry['title'])
+        if key in current: continue
+        first_seen = index.touch(key, now)
+        current[key] = (not watched(entry['title']), -(entry.get('published') or first_seen), len(current), entry['title'])
+    index.evict(now)
+    return [rank[-1] for rank in heapq.nsmallest(count, current.values())]
+
+class WatchMatcher:
+    # Watch words compiled into one case-insensitive pattern, with the matched spans of each headline cached
+    def __init__(self, words = (), cache_size: int = 1024):
+        self.cache_size = cache_size
+        self.compile(words)
+
+    def compile(self, words):
+        words = sorted({word for word in words if word}, key = len, reverse = True) # Longest first, so the longest match wins at each position
+        self.pattern = re.compile('|'.join(map(re.escape, words)), re.IGNORECASE) if words else None
+        self.cache = {}
+
+    def spans(self, text: str):
+        spans = self.cache.get(text)
+        if spans is None:
+            if len(self.cache) >= self.cache_size: self.cache.clear()
+            spans = self.cache[text] = [match.span() for match in self.pattern.finditer(text)] if self.pattern else []
+        return spans
+
+    def __call__(self, text: str): return bool(self.spans(text))
+
+if __name__ == '__main__':
+    # Benchmark: python3 headlines.py [page.html ...] (defaults to the recorded pages in fixtures/)
+    import glob, os, sys, timeit
+    pages = sys.argv[1:] or sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', '*.html')))
+    for page in pages:
+        with open(page, 'rb') as f: data = f.read()
+        soup_s = min(timeit.repeat(lambda: soup_headlines(data), number = 5, repeat = 3)) / 5
+        stream_s = min(timeit.repeat(lambda: extract_headlines(chunked(data)), number = 5, repeat = 3)) / 5
+        match = 'match' if soup_headlines(data) == extract_headlines(chunked(data)) else 'DIFFER'
+        print(f"{os.path.basename(page)} ({len(data) // 1024}KB): BeautifulSoup {soup_s * 1000:.1f}ms, streaming {stream_s * 1000:.1f}ms ({soup_s / stream_s:.0f}x), headlines {match}")
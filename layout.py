@@ -0,0 +1,43 @@
+# Cryptopaper layout: drawing in design coordinates (the 2200x1650 canvas) onto a surface of any size
+import math
+import pygame
+
+class Layout:
+    # Look-alikes of the pygame.draw calls used by the widgets, scaling every coordinate, width and radius on the way through.
+    # At scale 1 values pass through untouched, so the full-size output is unchanged
+    def __init__(self, scale: float = 1.0): self.scale = scale
+
+    def size(self, value):
+        if self.scale == 1.0 or not value: return value
+        return max(1, round(value * self.scale))
+
+    def point(self, point):
+        if self.scale == 1.0: return point
+        return round(point[0] * self.scale), round(point[1] * self.scale)
+
+    def area(self, rect) -> pygame.Rect:
+        # Edges are floored and ceiled so that neighbouring areas still meet
+        rect = pygame.Rect(rect)
+        if self.scale == 1.0: return rect
+        left, top = math.floor(rect.left * self.scale), math.floor(rect.top * self.scale)
+        return pygame.Rect(left, top, math.ceil(rect.right * self.scale) - left, math.ceil(rect.bottom * self.scale) - top)
+
+    def unscale(self, rect) -> pygame.Rect:
+        if self.scale == 1.0: return rect
+        left, top = round(rect.left / self.scale), round(rect.top / self.scale)
+        return pygame.Rect(left, top, round(rect.right / self.scale) - left, round(rect.bottom / self.scale) - top)
+
+    def line(self, surface, color, start, end, width: int = 1):
+        return pygame.draw.line(surface, color, self.point(start), self.point(end), self.size(width))
+
+    def rect(self, surface, color, rect, width: int = 0, border_radius: int = 0):
+        return pygame.draw.rect(surface, color, self.area(rect), self.size(width), self.size(border_radius))
+
+    def circle(self, surface, color, center, radius, width: int = 0):
+        return pygame.draw.circle(surface, color, self.point(center), self.size(radius), self.size(width))
+
+    def fill(self, surface, color, rect = None):
+        return surface.fill(color, self.area(rect) if rect else None)
+
+    def blit(self, surface, source, position, area = None):
+        return surface.blit(source, self.point(position), area)
@@ -0,0 +1,84 @@
+# Cryptopaper metrics: counters, gauges and histograms kept by the display, exported to a file and served by the options service
+import bisect, json, time
+from files import replace
+
+class Registry:
+    # Metrics by name, each a dict of series keyed by label values. Every series has a single writer (frames and widgets on the
+    # render thread, fetches on the thread that makes them) and export() copies before reading, so nothing takes a lock
+    def __init__(self):
+        self.kinds, self.help, self.buckets, self.values, self.collectors = {}, {}, {}, {}, []
+
+    def define(self, name: str, kind: str, help: str, buckets = None):
+        self.kinds[name], self.help[name], self.values[name] = kind, help, {}
+        if buckets: self.buckets[name] = tuple(buckets)
+
+    def counter(self, name: str, help: str): self.define(name, 'counter', help)
+    def gauge(self, name: str, help: str): self.define(name, 'gauge', help)
+    def histogram(self, name: str, help: str, buckets): self.define(name, 'histogram', help, buckets)
+    def collect(self, function): self.collectors.append(function) # Called before each export, to set values read from elsewhere
+
+    def inc(self, name: str, value: float = 1, **labels):
+        series, key = self.values[name], tuple(sorted(labels.items()))
+        series[key] = series.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels): self.values[name][tuple(sorted(labels.items()))] = value
+
+    def observe(self, name: str, value: float, **labels):
+        # A histogram series is a count per bucket, one more for values above the last bucket, then the sum
+        series, key, buckets = self.values[name], tuple(sorted(labels.items())), self.buckets[name]
+        counts = series.get(key) or series.setdefault(key, [0] * (len(buckets) + 1) + [0.0])
+        counts[bisect.bisect_left(buckets, value)] += 1
+        counts[-1] += value
+
+    def snapshot(self):
+        for collect in self.collectors: collect()
+        return [{'name': name, 'type': kind, 'help': self.help[name], 'buckets': self.buckets.get(name),
+            'series': [[dict(key), list(value) if kind == 'histogram' else value] for key, value in dict(self.values[name]).items()]} for name, kind in self.kinds.items()]
+
+    def export(self, path: str, **info):
+        replace(path, json.dumps({**info, 'updated': time.time(), 'metrics': self.snapshot()}).encode())
+
+# Reading an export, for the options service
+def read(path: str):
+    try:
+        with open(path) as f: return json.load(f)
+    except (OSError, ValueError): return None
+
+def escape(value) -> str: return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def label_text(labels: dict, **extra):
+    pairs = [f'{key}="{escape(value)}"' for key, value in {**labels, **extra}.items()]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def prometheus(document, stale: float) -> str:
+    # Prometheus text format. `cryptopaper_up` is 0 when the display has not exported for `stale` seconds
+    age = time.time() - document['updated'] if document else None
+    lines = ['# HELP cryptopaper_up Whether the display exported metrics recently', '# TYPE cryptopaper_up gauge', f'cryptopaper_up {int(age is not None and age < stale)}']
+    if document is None: return '\n'.join(lines) + '\n'
+    lines += ['# HELP cryptopaper_metrics_age_seconds Time since the display last exported metrics', '# TYPE cryptopaper_metrics_age_seconds gauge', f'cryptopaper_metrics_age_seconds {age:.3f}']
+    for metric in document['metrics']:
+        name = metric['name']
+        lines += [f"# HELP {name} {metric['help']}", f"# TYPE {name} {metric['type']}"]
+        for labels, value in metric['series']:
+            if metric['type'] != 'histogram':
+                lines.append(f'{name}{label_text(labels)} {value}')
+                continue
+            total = 0
+            for bound, count in zip(metric['buckets'] + ['+Inf'], value[:-1]):
+                total += count
+                lines.append(f'{name}_bucket{label_text(labels, le = bound)} {total}')
+            lines += [f'{name}_sum{label_text(labels)} {value[-1]}', f'{name}_count{label_text(labels)} {total}']
+    return '\n'.join(lines) + '\n'
+
+def status(document, stale: float) -> dict:
+    # The same figures as plain JSON: unlabelled metrics as values, labelled ones by `key=value` label text, histograms as count, sum and count per bucket
+    age = time.time() - document['updated']
+    result = {key: value for key, value in document.items() if key != 'metrics'}
+    result.update(up = age < stale, age = round(age, 1))
+    for metric in document['metrics']:
+        values = {}
+        for labels, value in metric['series']:
+            if metric['type'] == 'histogram': value = {'count': sum(value[:-1]), 'sum': round(value[-1], 6), 'buckets': dict(zip(map(str, metric['buckets'] + ['+Inf']), value[:-1]))}
+            values[','.join(f'{key}={label}' for key, label in labels.items())] = value
+        result[metric['name'].replace('cryptopaper_', '', 1)] = values[''] if list(values) == [''] else values
+    return result
@@ -1,15 +1,25 @@
 # Cryptopaper Options Service
 WSGI = True
-from flask import Flask, render_template, request, send_file
+from flask import Flask, Response, make_response, render_template, request
 from flask_cors import CORS
 from datetime import datetime
 if WSGI: from waitress import serve
-import os, re, subprocess
+import os, re, socket, subprocess, tempfile, threading, time
+import metrics
 
 LIBDIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'lib')
 OPTIONS_FILE = os.path.join(LIBDIR, 'options.txt')
 WATCH_WORDS_FILE = os.path.join(LIBDIR, 'watch-words.txt')
 PORT = 5000
+CONFIG_PORT = PORT + 1 # The display listens here for saved changes
+FRAME_DIR = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+FRAME_FILE, METRICS_FILE = os.path.join(FRAME_DIR, 'cryptopaper-frame.jpg'), os.path.join(FRAME_DIR, 'cryptopaper-metrics.json') # Published by the display
+FRAME_ACK = os.path.join(FRAME_DIR, 'cryptopaper-frame.ack') # Touched by the display when the frame already published is current
+METRICS_STALE = 30 # Seconds without an export before the display counts as down
+FRAME_WAIT, STREAM_POLL = 2.0, 0.25
+STREAM_KEEPALIVE, STREAM_IDLE = 5.0, 600 # Resend the last frame this often, so a viewer who left is noticed; give up after this long without a new one
+THREADS, STREAM_LIMIT = 8, 5 # Each stream viewer holds a waitress thread, so some are always left for everything else
+stream_slots = threading.BoundedSemaphore(STREAM_LIMIT)
 
 app = Flask(__name__, template_folder='lib')
 CORS(app)
@@ -27,12 +37,34 @@ def sanitize_threshold(s):
     try: return "{:.4f}".format(float(s)) if float(s) > 0 else '0.0001'
     except ValueError: return '0.0002'
 
+def notify_display(message = b'reload'):
+    # Tell the running display to reload its options (or that someone is watching); it also notices file changes on its own, so this is best effort
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s: s.sendto(message, ('127.0.0.1', CONFIG_PORT))
+    except OSError: pass
+
+def frame_age(path = FRAME_FILE):
+    try: return time.time() - os.stat(path).st_mtime
+    except FileNotFoundError: return None
+
+def frame_current():
+    # A frame published in the last couple of seconds, or an older one the display has just said is still what it shows
+    return frame_age() is not None and any(age is not None and age <= FRAME_WAIT for age in (frame_age(), frame_age(FRAME_ACK)))
+
+def wait_for_frame():
+    # The display only publishes frames while someone is watching, so ask for one and give it a moment if ours is stale
+    notify_display(b'view')
+    deadline = time.time() + FRAME_WAIT
+    while time.time() < deadline and not frame_current(): time.sleep(0.05)
+    return frame_age() is not None
+
 def is_raspberry_pi():
     return any('BCM' in line for line in open('/proc/cpuinfo'))
 
 @app.after_request
 def add_header(response):
-    response.headers['Cache-Control'] = 'no-store, no-cache, must-revalidate, post-check=0, pre-check=0, max-age=0'
+    # Frames carry an ETag so unchanged ones can be revalidated cheaply; everything else is never cached
+    response.headers['Cache-Control'] = 'no-cache' if response.get_etag()[0] else 'no-store, no-cache, must-revalidate, post-check=0, pre-check=0, max-age=0'
     response.headers['Pragma'] = 'no-cache'
     response.headers['Expires'] = '-1'
     return response
@@ -68,6 +100,7 @@ def save_watch_words():
     try:
         with open(WATCH_WORDS_FILE, 'w') as file:
             file.write(text)
+        notify_display()
         return {'message': 'File saved successfully.'}
     except: return {'error': 'An error occurred while saving the watch-words file.'}
 
@@ -78,6 +111,7 @@ def save_options():
     try:
         with open(OPTIONS_FILE, 'w') as file:
             file.write(threshold + '\n' + location)
+        notify_display()
         return {'message': 'File saved successfully.'}
     except: return {'error': 'An error occurred while saving the options file.'}
 
@@ -98,13 +132,45 @@ def run_patch():
 
 @app.route('/screenshot')
 def screenshot():
-    file_path = 'screenshot.png'
-    if os.path.exists(file_path):
-        os.remove(file_path)
-    env = os.environ.copy()
-    env['DISPLAY'] = ':0'
-    subprocess.run(['scrot', file_path], env=env, check=True)
-    return send_file(file_path, mimetype='image/png', as_attachment=True)
+    if not wait_for_frame(): return {'error': 'No frame available. Is the display running?'}, 503
+    with open(FRAME_FILE, 'rb') as file:
+        info = os.fstat(file.fileno())
+        response = make_response(file.read())
+    response.mimetype = 'image/jpeg'
+    response.set_etag(f'{info.st_mtime_ns:x}-{info.st_size:x}')
+    return response.make_conditional(request)
+
+@app.route('/mjpeg')
+def mjpeg():
+    # Push each new frame as it is published; the display encodes it once for all viewers.
+    # The last frame goes out again every few seconds, as a write is the only way to find out the viewer has gone
+    if not stream_slots.acquire(blocking = False): return {'error': f'Too many viewers; at most {STREAM_LIMIT} streams at once'}, 503
+    def frames():
+        last, data, changed, sent = None, None, time.time(), 0.0
+        while time.time() - changed < STREAM_IDLE:
+            notify_display(b'view')
+            try:
+                with open(FRAME_FILE, 'rb') as file:
+                    info = os.fstat(file.fileno())
+                    if (info.st_mtime_ns, info.st_size) != last: last, data, changed = (info.st_mtime_ns, info.st_size), file.read(), time.time()
+            except FileNotFoundError: pass
+            if data and (changed > sent or time.time() - sent >= STREAM_KEEPALIVE):
+                sent = time.time()
+                yield b'--frame\r\nContent-Type: image/jpeg\r\nContent-Length: ' + str(len(data)).encode() + b'\r\n\r\n' + data + b'\r\n'
+            time.sleep(STREAM_POLL)
+    response = Response(frames(), mimetype='multipart/x-mixed-replace; boundary=frame')
+    response.call_on_close(stream_slots.release) # Whether the stream ended, timed out or the viewer went
+    return response
+
+@app.route('/metrics')
+def prometheus_metrics():
+    return Response(metrics.prometheus(metrics.read(METRICS_FILE), METRICS_STALE), mimetype='text/plain; version=0.0.4')
+
+@app.route('/status')
+def status():
+    document = metrics.read(METRICS_FILE)
+    if document is None: return {'error': 'No metrics available. Is the display running?', 'up': False}, 503
+    return metrics.status(document, METRICS_STALE)
 
 @app.route('/stream')
 def stream():
@@ -112,17 +178,9 @@ def stream():
     <html>
     <head>
         <title>Stream</title>
-        <script type="text/javascript">
-            function refreshImage() {
-                var img = document.getElementById('screenshot');
-                var src = "/screenshot?" + new Date().getTime();
-                img.src = src;
-            }
-            setInterval(refreshImage, 1000);
-        </script>
     </head>
     <body style = "padding: 0px; margin: 0px; background-color: #000;">
-        <img id="screenshot" src="/screenshot" alt="Screenshot">
+        <img id="screenshot" src="/mjpeg" alt="Live stream">
     </body>
     </html>
     '''
@@ -131,6 +189,6 @@ def stream():
     
 if __name__ == '__main__':
     if WSGI:
-        serve(app, host="0.0.0.0", port = PORT)
+        serve(app, host="0.0.0.0", port = PORT, threads = THREADS)
     else: 
         app.run(host = "0.0.0.0", port = PORT)
@@ -0,0 +1,106 @@
+# Cryptopaper replay: recorded prices, headlines, weather and war figures fed through the real candle, scheduling and render code
+# on a simulated clock, headless and as fast as it will go
+# Usage:
+#   python3 replay.py                   a simulated day at 800x600, reporting every simulated hour
+#   python3 replay.py 1872 --days=7     a week at 1872x1404
+#   python3 replay.py --speed=100       no faster than 100x real time
+#   python3 replay.py --every=600       report every ten simulated minutes
+#   python3 replay.py --sink=pbm:/tmp/replay.pbm   write e-paper frames too
+# --candles=, --feed=, --weather= and --war= replace the recordings in fixtures/ (--war is a directory of russia_losses_*.json)
+import csv, datetime, gc, os, random, sys, tempfile, time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+FIXTURES = os.path.join(HERE, 'fixtures')
+
+class SimulatedClock:
+    # Stands in for time.time as cryptopaper.CLOCK; the replay loop moves it on
+    def __init__(self, now: float): self.now = now
+    def __call__(self): return self.now
+
+def load_candles(path: str):
+    with open(path) as f: return [[float(value) for value in row] for row in list(csv.reader(f))[1:]]
+
+def ticks(candles, secs: int):
+    # Four trades per recorded candle (open, high, low, close), looped for as long as needed.
+    # Each pass is shifted in time, and in price to carry on from the last close, so the series never jumps
+    t_shift, price_shift, span = 0.0, 0.0, len(candles) * secs
+    while True:
+        for t, open_, high, low, close, volume in candles:
+            for offset, price in ((1, open_), (8, high), (16, low), (secs - 1, close)): yield t + t_shift + offset, price + price_shift, volume / 4
+        t_shift, price_shift = t_shift + span, price_shift + candles[-1][4] - candles[0][1]
+
+def rss():
+    with open('/proc/self/statm') as f: return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+def main():
+    flags, widths = [arg for arg in sys.argv[1:] if arg.startswith('--')], [arg for arg in sys.argv[1:] if arg.isdigit()]
+    sys.argv = ['cryptopaper.py', (widths or ['800'])[0], '--headless', *flags]
+    if not any(flag.startswith('--sink') for flag in flags): sys.argv.append('--sink=') # No frame files unless asked for
+    import cryptopaper as c
+    from headlines import parse_feed, HeadlineIndex, rank_headlines
+
+    days, speed, every = float(c.option('days', 1)), float(c.option('speed', 0)), int(c.option('every', 3600))
+    candles = load_candles(c.option('candles', os.path.join(FIXTURES, 'btcusd-candles.csv')))
+    with open(c.option('feed', os.path.join(FIXTURES, 'bbc-world.rss')), 'rb') as f: feed = parse_feed(f.read(), 'replay', 1000)
+    war = os.path.abspath(c.option('war', FIXTURES))
+
+    # Data sources: the real weather and war fetchers read the recordings through file:// URLs; headlines rotate through the feed hourly
+    start = candles[0][0]
+    sim, rng, index = SimulatedClock(start), random.Random(1), HeadlineIndex(c.NEWS_TTL)
+    c.CLOCK, c.T_START = sim, int(start) // 60
+    c.WEATHER_URL = 'file://' + os.path.abspath(c.option('weather', os.path.join(FIXTURES, 'weather.txt')))
+    c.WAR_DATASET, c.WAR_CACHE = 'file://' + os.path.join(war, 'russia_losses_{}.json'), os.path.join(tempfile.mkdtemp(), 'war-stats.json')
+    c.LTC_ALARM, c.LOCATION = 0.004, 'Replay'
+    c.load_watch_list()
+    c.ASSETS.add('qr', c.generate_qr_code(f'http://10.0.0.1:{c.PORT}'), c.layout.scale)
+    c.publish(ip_addr = '10.0.0.1')
+
+    def news_source():
+        hour = int(sim.now // 3600)
+        entries = [feed[(hour * 3 + i) % len(feed)] for i in range(c.NEWS_PER_SOURCE)]
+        return {'news': rank_headlines(entries, index, c.watch_matcher, now = sim.now)}
+
+    def ltc_source():
+        c.update_ticker('ltcbtc', 0.0039 + rng.gauss(0, 0.00005), t = sim.now)
+        return {}
+
+    sources = {'weather': (c.weather_source, c.next_half_past), 'war': (c.war_source, c.next_war_update),
+        'news': (news_source, c.next_minute), 'ltc': (ltc_source, lambda now: now + c.LTC_INTERVAL)}
+
+    # Replay, one frame per simulated second as on a panel
+    trades, end = ticks(candles, c.SECS_PER_CANDLE), start + days * 86400
+    t, price, volume = next(trades)
+    gc.collect()
+    began, first_rss, first_objects = time.perf_counter(), rss(), len(gc.get_objects())
+    last = {'wall': began, 'second': start, 'frames': 0, 'rss': first_rss, 'objects': first_objects}
+    frames, slowest, warm = 0, 0.0, None
+    print(f"{'simulated':>16} {'wall':>8} {'speed':>7} {'frames/s':>9} {'candles/s':>10} {'rss':>9} {'objects':>9}")
+    for second in range(int(start), int(end)):
+        sim.now = second
+        while t <= second:
+            c.update_ticker('btcusd', price, volume, t)
+            t, price, volume = next(trades)
+        for name in c.due_sources(second, sources): c.publish(**sources[name][0]())
+        if not c.handle_events(): break
+        frame_started = time.perf_counter()
+        c.frame(second)
+        slowest = max(slowest, time.perf_counter() - frame_started)
+        frames += 1
+        if speed: time.sleep(max(0.0, began + (second - start) / speed - time.perf_counter()))
+        if (second + 1 - start) % every == 0 or second + 1 >= end:
+            now, objects, memory = time.perf_counter(), len(gc.get_objects()), rss()
+            wall, simulated = now - last['wall'], second + 1 - last['second']
+            print(f"{datetime.datetime.fromtimestamp(second + 1).strftime('%b-%d %H:%M:%S'):>16} {now - began:>7.1f}s {simulated / wall:>6.0f}x {(frames - last['frames']) / wall:>9.0f} "
+                f"{simulated / c.SECS_PER_CANDLE / wall:>10.1f} {memory / 2**20:>7.1f}MB {objects:>9,}")
+            last.update(wall = now, second = second + 1, frames = frames, rss = memory, objects = objects)
+            warm = warm or dict(last) # Growth is measured from the first report, once the caches have filled
+
+    wall, days = time.perf_counter() - began, max(last['second'] - warm['second'], 1) / 86400
+    histogram = c.METRICS.values['cryptopaper_frame_seconds'].get((), [])
+    print(f"\n{frames:,} frames and {int(last['second'] - start) // c.SECS_PER_CANDLE:,} candles in {wall:.1f}s: {(last['second'] - start) / wall:,.0f}x real time, {frames / wall:,.0f} frames/s, slowest frame {slowest * 1000:.1f}ms")
+    print('Frame times: ' + '  '.join(f"<={ms}ms: {count}" for ms, count in zip(list(c.FRAME_BUCKETS_MS) + ['>' + str(c.FRAME_BUCKETS_MS[-1])], histogram) if count))
+    print(f"Memory: RSS {first_rss / 2**20:.1f}MB -> {warm['rss'] / 2**20:.1f}MB at the first report -> {last['rss'] / 2**20:.1f}MB ({(last['rss'] - warm['rss']) / 2**20 / days:+.1f}MB per simulated day after it), "
+        f"objects {first_objects:,} -> {warm['objects']:,} -> {last['objects']:,} ({(last['objects'] - warm['objects']) / days:+,.0f} per simulated day)")
+    print(f"Candles held: {len(c.candle_store):,}, gaps: {c.candle_store.gaps}, text cache: {len(c.text_cache)} lines, headlines seen: {len(index.seen)}")
+
+if __name__ == '__main__': main()
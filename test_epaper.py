@@ -0,0 +1,35 @@
+# Cryptopaper e-paper check: every sink kind keeps writing frames without leaking.
+# Live objects are counted rather than RSS, which moves with the allocator; the pygame 2.3 PNG leak was 6 objects a frame
+# Usage:
+#   python3 test_epaper.py     (or pytest test_epaper.py)
+import gc, os, tempfile
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+import pygame
+import epaper
+
+FRAMES, WARMUP = 150, 10
+
+def growth(kind: str):
+    # Live objects gained over FRAMES frames, each one different, after the first WARMUP
+    path = os.path.join(tempfile.mkdtemp(), 'panel.' + kind)
+    sink, surface = epaper.Sink(f'{kind}:{path}'), pygame.Surface((800, 600))
+    surface.fill((255, 255, 255))
+    for i in range(WARMUP + FRAMES):
+        if i == WARMUP:
+            gc.collect()
+            objects = len(gc.get_objects())
+        surface.fill((0, 0, 0), (i % 800, 0, 1, 600))
+        surface.fill((255, 255, 255), ((i - 1) % 800, 0, 1, 600))
+        assert epaper.emit([sink], surface) == 1
+    gc.collect()
+    assert os.listdir(os.path.dirname(path)) == ['panel.' + kind], 'left scratch files behind'
+    return len(gc.get_objects()) - objects
+
+def test_sinks_stay_flat():
+    for kind in epaper.DEPTHS:
+        objects = growth(kind)
+        assert objects < 20, f'{kind}: {objects} objects gained over {FRAMES} frames'
+
+if __name__ == '__main__':
+    test_sinks_stay_flat()
+    print('E-paper check passed')
@@ -0,0 +1,125 @@
+# Cryptopaper hub check: serve_hub over a temporary socket to two clients in this process, then follow_hub replaying what they were sent
+# Usage:
+#   python3 test_hub.py     (or pytest test_hub.py)
+import asyncio, json, os, sys, tempfile, threading, time
+
+sys.argv = ['cryptopaper.py', '800', '--headless', '--sink=']
+import cryptopaper as c
+from candles import CandleStore, T, CLOSE
+
+async def until(condition, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        await asyncio.sleep(0.02)
+
+async def receive(reader, timeout: float = 5.0):
+    line = await asyncio.wait_for(reader.readline(), timeout)
+    assert line, 'hub closed the connection'
+    return line
+
+async def receive_until(reader, condition):
+    # Lines up to and including the first one that satisfies condition
+    lines = [await receive(reader)]
+    while not condition(json.loads(lines[-1])): lines.append(await receive(reader))
+    return lines
+
+async def drain(reader, quiet: float = 1.2):
+    # Lines until none has come for `quiet` seconds, longer than the hub's tick
+    lines = []
+    while True:
+        try: lines.append(await asyncio.wait_for(reader.readline(), quiet))
+        except asyncio.TimeoutError: return lines
+
+async def check_hub(path: str):
+    # Full state first, then the same deltas to every client: changed keys only, with the open candle upserted
+    secs, now = c.SECS_PER_CANDLE, time.time()
+    c.candle_store, c.snapshot = CandleStore(100, secs), {}
+    for i, price in enumerate((100.0, 110.0, 105.0, 120.0)): c.update_ticker('btcusd', price, 1.0, now - (3 - i) * secs)
+    c.publish(weather = 'Sunny', news = [['Headline', 0]])
+    stop_event = threading.Event()
+    hub = asyncio.ensure_future(c.serve_hub(stop_event, path))
+    try:
+        await until(lambda: os.path.exists(path))
+        reader_a, writer_a = await asyncio.open_unix_connection(path, limit = c.HUB_LIMIT)
+        lines = [await receive(reader_a)]
+        full = json.loads(lines[0])
+        assert full['full'] and full['state']['weather'] == 'Sunny' and full['state']['btc_usd_spot'] == 120.0
+        assert full['candles'] == c.candle_store.last().tolist()
+        lines += await drain(reader_a) # The hub's first tick sends everything, as it has sent nothing yet
+
+        c.update_ticker('btcusd', 125.0, 0.5, time.time()) # A trade in the open candle
+        lines += await receive_until(reader_a, lambda message: 'btc_usd_spot' in message['state'])
+        delta = json.loads(lines[-1])
+        assert delta['state'] == {'btc_usd_spot': 125.0}, delta
+        assert delta['candles'][-1] == c.candle_store.last(1)[0].tolist() and delta['candles'][-1][CLOSE] == 125.0
+        assert all(row[T] >= full['candles'][-1][T] for row in delta['candles']), 'resent closed candles'
+
+        reader_b, writer_b = await asyncio.open_unix_connection(path, limit = c.HUB_LIMIT)
+        late = json.loads(await receive(reader_b))
+        assert late['full'] and late['state']['btc_usd_spot'] == 125.0 and late['candles'] == c.candle_store.last().tolist()
+        c.publish(weather = 'Rain')
+        lines += await receive_until(reader_a, lambda message: 'weather' in message['state'])
+        seen_b = await receive_until(reader_b, lambda message: 'weather' in message['state'])
+        assert seen_b[-1] == lines[-1], 'clients were sent different deltas'
+        assert json.loads(lines[-1])['state'] == {'weather': 'Rain'}
+
+        writer_b.close() # One client leaving does not stop the others
+        c.publish(weather = 'Snow')
+        lines += await receive_until(reader_a, lambda message: 'weather' in message['state'])
+        candles = c.candle_store.last() # The next roll is a second away
+        writer_a.close()
+    finally:
+        stop_event.set()
+        hub.cancel()
+        await asyncio.gather(hub, return_exceptions = True)
+    assert not os.path.exists(path), 'left the socket behind'
+    return lines, candles
+
+async def check_follower(path: str, lines: list, candles):
+    # The first connection replays what the hub sent, then hangs up; the reconnection gets a new full state
+    restarted = [[candles[-1][T] + c.SECS_PER_CANDLE, 200.0, 210.0, 190.0, 205.0, 3.0]]
+    connected_at, hang_up = [], asyncio.Event()
+
+    async def hub(reader, writer):
+        connected_at.append(time.monotonic())
+        if len(connected_at) == 1:
+            for line in lines: writer.write(line)
+            await hang_up.wait()
+        else:
+            writer.write(json.dumps({'full': True, 'state': {'btc_usd_spot': 205.0}, 'candles': restarted}).encode() + b'\n')
+            await reader.read()
+        writer.close()
+
+    server = await asyncio.start_unix_server(hub, path)
+    c.candle_store, c.snapshot, c.btc_usd_spot = CandleStore(100, c.SECS_PER_CANDLE), {}, 0.0
+    stop_event = threading.Event()
+    follower = asyncio.ensure_future(c.follow_hub(stop_event, path))
+    try:
+        await until(lambda: c.snapshot.get('weather') == 'Snow')
+        assert c.candle_store.last().tolist() == candles.tolist()
+        assert c.candle_store.last(1)[0, CLOSE] == 125.0 and c.btc_usd_spot == 125.0
+        assert c.snapshot['news'] == [['Headline', 0]] and c.snapshot.pop('reload_chart')
+
+        hang_up.set()
+        await until(lambda: len(connected_at) == 2 and c.btc_usd_spot == 205.0)
+        await until(lambda: c.candle_store.last().tolist() == restarted)
+        assert c.snapshot.pop('reload_chart'), 'a reconnection must redraw the chart'
+        assert connected_at[1] - connected_at[0] >= 0.9, 'reconnected without backing off'
+    finally:
+        stop_event.set()
+        follower.cancel()
+        await asyncio.gather(follower, return_exceptions = True)
+        server.close()
+        await server.wait_closed()
+
+async def check():
+    path = os.path.join(tempfile.mkdtemp(), 'hub.sock')
+    lines, candles = await check_hub(path)
+    await check_follower(path, lines, candles)
+
+def test_hub(): asyncio.run(check())
+
+if __name__ == '__main__':
+    test_hub()
+    print('Hub check passed')
@@ -0,0 +1,108 @@
+# Cryptopaper stream check: stream_trades against a local fake of Bitstamp's WebSocket API, replaying fixtures/btcusd-trades.jsonl
+# Usage:
+#   python3 test_stream.py     (or pytest test_stream.py)
+import asyncio, json, os, sys, threading, time
+import aiohttp
+from aiohttp import web
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+TRADES = os.path.join(HERE, 'fixtures', 'btcusd-trades.jsonl')
+POLL_INTERVAL = 0.2 # Ticker polling, sped up so the fallback shows within the check
+
+sys.argv = ['cryptopaper.py', '800', '--headless', '--sink=']
+import cryptopaper as c
+from candles import CandleStore, T, OPEN, HIGH, LOW, CLOSE, VOLUME
+
+class FakeBitstamp:
+    # Answers subscriptions like ws.bitstamp.net. The first connection gets the recording, then is closed once `hang_up` is set;
+    # later ones are held open. The REST ticker always fails, so polls are counted without touching the candles
+    def __init__(self, messages):
+        self.messages, self.hang_up = messages, asyncio.Event()
+        self.subscriptions, self.connected_at, self.ticker_hits = [], [], 0
+
+    async def stream(self, request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        self.connected_at.append(time.monotonic())
+        subscribe = await ws.receive_json()
+        self.subscriptions.append(subscribe)
+        await ws.send_json({'event': 'bts:subscription_succeeded', 'channel': subscribe['data']['channel'], 'data': {}})
+        if len(self.connected_at) == 1:
+            for message in self.messages: await ws.send_str(message)
+            await self.hang_up.wait()
+            await ws.close()
+        else:
+            async for _ in ws: pass
+        return ws
+
+    async def ticker(self, request):
+        self.ticker_hits += 1
+        return web.json_response({}, status = 503)
+
+def expected_candles(messages, secs: int):
+    # The recording folded into candles by hand: first, highest, lowest and last price and total amount per bucket
+    candles = {}
+    for message in messages:
+        trade = json.loads(message)['data']
+        t, price, amount = int(trade['microtimestamp']) / 1e6, float(trade['price']), float(trade['amount'])
+        row = candles.setdefault(int(t) // secs * secs, [int(t) // secs * secs, price, price, price, price, 0.0])
+        row[HIGH], row[LOW], row[CLOSE], row[VOLUME] = max(row[HIGH], price), min(row[LOW], price), price, row[VOLUME] + amount
+    return np.array(sorted(candles.values()))
+
+async def until(condition, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        await asyncio.sleep(0.02)
+
+async def check():
+    with open(TRADES) as f: messages = [line.strip() for line in f if line.strip()]
+    expected, server = expected_candles(messages, c.SECS_PER_CANDLE), FakeBitstamp(messages)
+    app = web.Application()
+    app.router.add_get('/ws', server.stream)
+    app.router.add_get('/ticker/{pair}', server.ticker)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    c.BITSTAMP_STREAM, c.BITSTAMP_TICKER = f'ws://127.0.0.1:{port}/ws', f'http://127.0.0.1:{port}/ticker/{{}}'
+    c.candle_store = CandleStore(100, c.SECS_PER_CANDLE)
+    c.streaming.clear()
+
+    stop_event = threading.Event()
+    async with aiohttp.ClientSession() as session:
+        tasks = [asyncio.ensure_future(c.stream_trades(session, stop_event, ('btcusd',))), asyncio.ensure_future(c.poll_tickers(session, stop_event, {'btcusd': POLL_INTERVAL}))]
+        try:
+            # Every trade folded into its bucket, while polling stands aside
+            await until(lambda: len(c.candle_store) == len(expected) and abs(c.candle_store.last()[:, VOLUME].sum() - expected[:, VOLUME].sum()) < 1e-6)
+            assert server.subscriptions == [{'event': 'bts:subscribe', 'data': {'channel': 'live_trades_btcusd'}}]
+            assert 'btcusd' in c.streaming
+            candles = c.candle_store.last()
+            assert np.array_equal(candles[:, [T, OPEN, HIGH, LOW, CLOSE]], expected[:, [T, OPEN, HIGH, LOW, CLOSE]]), candles
+            assert np.allclose(candles[:, VOLUME], expected[:, VOLUME])
+            assert c.tickers['btcusd'] == expected[-1, CLOSE]
+            polls = server.ticker_hits
+            await asyncio.sleep(POLL_INTERVAL * 3)
+            assert server.ticker_hits == polls, 'polled while streaming'
+
+            # The socket closes: polling takes over, and the stream comes back after its backoff
+            server.hang_up.set()
+            await until(lambda: not c.streaming)
+            closed = time.monotonic()
+            await until(lambda: server.ticker_hits > polls)
+            await until(lambda: len(server.connected_at) == 2 and 'btcusd' in c.streaming)
+            assert server.connected_at[1] - closed >= 0.9, 'reconnected without backing off'
+            assert len(server.subscriptions) == 2
+        finally:
+            stop_event.set()
+            for task in tasks: task.cancel()
+            await asyncio.gather(*tasks, return_exceptions = True)
+    await runner.cleanup()
+
+def test_stream_trades(): asyncio.run(check())
+
+if __name__ == '__main__':
+    test_stream_trades()
+    print('Stream check passed')
@@ -0,0 +1,96 @@
+# Cryptopaper war data check: tail_records and fetch_dataset_tail against the recorded datasets, served by bench.py's fixture server
+# Usage:
+#   python3 test_war.py     (or pytest test_war.py)
+import datetime, http.server, io, json, os, sys, tempfile, threading
+
+sys.argv = ['cryptopaper.py', '800', '--headless', '--sink=']
+import cryptopaper as c
+from bench import FixtureHandler, FIXTURES
+
+DATASETS = ('personnel', 'equipment')
+CUTS, CHUNKS, COUNTS = (1, 100, 4096, 16384, 50000), (1, 7, 64, 4096, 16384), (1, 2, 41)
+
+class CountingHandler(FixtureHandler):
+    # Remembers each request's range and the status it got
+    requests = []
+    def send_response(self, code, message = None):
+        self.requests.append((self.headers.get('Range'), code))
+        super().send_response(code, message)
+
+class SimulatedClock:
+    def __init__(self, now: float): self.now = now
+    def __call__(self): return self.now
+
+def dataset(name: str):
+    with open(os.path.join(FIXTURES, f'russia_losses_{name}.json'), 'rb') as f: data = f.read()
+    return data, json.loads(data)
+
+def test_tail_records():
+    for name in DATASETS:
+        data, records = dataset(name)
+        for chunk in CHUNKS:
+            for count in COUNTS:
+                if chunk >= 64: assert c.tail_records(io.BytesIO(data), count, False, chunk) == records[-count:], (name, chunk, count) # Byte by byte through 200KB is just slow
+                for cut in CUTS:
+                    # A ranged body starts mid-record: everything from the first record that starts after its first `}`
+                    first_close = data.index(b'}', len(data) - cut) if b'}' in data[-cut:] else len(data)
+                    complete = data.count(b'{', first_close)
+                    expected = records[-min(count, complete):] if complete else []
+                    assert c.tail_records(io.BytesIO(data[-cut:]), count, True, chunk) == expected, (name, chunk, count, cut)
+
+def test_fetch_dataset_tail():
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), CountingHandler)
+    threading.Thread(target = server.serve_forever, daemon = True).start()
+    requests, tail_bytes = CountingHandler.requests, c.WAR_TAIL_BYTES
+    c.WAR_DATASET = f'http://127.0.0.1:{server.server_address[1]}/russia_losses_{{}}.json'
+    try:
+        for name in DATASETS:
+            _, records = dataset(name)
+            # A tail long enough takes one ranged request, and a repeat costs a 304 that reuses the cached records
+            cache = {}
+            requests.clear()
+            assert c.fetch_dataset_tail(name, 3, cache) == records[-3:]
+            assert requests == [(f'bytes=-{tail_bytes}', 206)] and cache[name]['etag']
+            cached = cache[name]['records']
+            requests.clear()
+            assert c.fetch_dataset_tail(name, 3, cache) is cached
+            assert requests == [(f'bytes=-{tail_bytes}', 304)]
+
+            # A tail too short for the count falls back to the whole file
+            c.WAR_TAIL_BYTES = 300
+            cache = {}
+            requests.clear()
+            assert c.fetch_dataset_tail(name, 41, cache) == records[-41:]
+            assert requests == [('bytes=-300', 206), (None, 200)]
+            c.WAR_TAIL_BYTES = tail_bytes
+    finally:
+        c.WAR_TAIL_BYTES = tail_bytes
+        server.shutdown()
+
+def test_war_cache_expiry():
+    # Figures fetched since the last 14:05 update are reused without a request; after the next one they are revalidated
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), CountingHandler)
+    threading.Thread(target = server.serve_forever, daemon = True).start()
+    requests, clock = CountingHandler.requests, c.CLOCK
+    c.WAR_DATASET = f'http://127.0.0.1:{server.server_address[1]}/russia_losses_{{}}.json'
+    c.WAR_CACHE = os.path.join(tempfile.mkdtemp(), 'war-stats.json')
+    c.CLOCK = SimulatedClock(datetime.datetime(2024, 10, 1, 15, 0).timestamp())
+    try:
+        requests.clear()
+        fresh = c.fetch_orc_stats(c.WAR_DAYS, use_cache = True)
+        assert [code for _, code in requests] == [206, 206]
+        requests.clear()
+        c.CLOCK.now += 20 * 3600 # 11:00 the next day
+        assert c.fetch_orc_stats(c.WAR_DAYS, use_cache = True) == fresh and requests == []
+        c.CLOCK.now += 4 * 3600 # 15:00, after the day's update
+        assert c.fetch_orc_stats(c.WAR_DAYS, use_cache = True) == fresh
+        assert [code for _, code in requests] == [304, 304]
+    finally:
+        c.CLOCK = clock
+        server.shutdown()
+
+if __name__ == '__main__':
+    test_tail_records()
+    test_fetch_dataset_tail()
+    test_war_cache_expiry()
+    print('War data check passed')